@@ -1,18 +1,73 @@
 from src.scripts.models import create_tables
 from src.utils.logger import logger
 from src.routes import routes
-from fastapi import FastAPI
-from fastapi_pagination import add_pagination
+from src.config import Config
+from src.services.inference import model_registry
+from src.services.prefix_cache import prefix_cache
+from src.services.semantic_cache import semantic_cache
+from src.services.trends import trend_memo
+from src.services.user_cache import user_cache
+from src.services.token import blacklist_filter
+from src.services.token_maintenance import token_maintenance
+from src.services.password import password_hasher
+from src.utils.broadcast import broadcast
+from src.utils.metrics import metrics
+from src.models import replica_router
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse
 
 app = FastAPI()
 
 
+@app.on_event("startup")
+def load_models():
+    if Config.PRELOAD_MODELS:
+        model_registry.load_in_background()
+
+
+@app.on_event("startup")
+def listen_for_invalidations():
+    user_cache.start_listener()
+    blacklist_filter.start()
+
+
+@app.on_event("startup")
+def start_token_maintenance():
+    token_maintenance.start()
+
+
 @app.get("/")
 def ping():
     logger.debug("::> Server Health check")
     return "MHC SERVICE HEALTHY"
 
 
+@app.get("/ready")
+def ready():
+    model_status = model_registry.status()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if model_status["ready"]
+        else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=model_status
+    )
+
+
+@app.get("/metrics")
+def get_metrics():
+    return {
+        **metrics.snapshot(),
+        "prefix_cache": prefix_cache.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "trends_cache": trend_memo.stats(),
+        "replicas": replica_router.status(),
+        "user_cache": user_cache.stats(),
+        "token_blacklist": blacklist_filter.stats(),
+        "broadcast": broadcast.stats(),
+        "password_hasher": password_hasher.stats(),
+        "token_maintenance": token_maintenance.stats()
+    }
+
+
 app.include_router(routes)
 
 
@@ -30,6 +85,3 @@ if __name__ == "__main__":
         reload=True,
         log_level="info"
     )
-
-
-add_pagination(app)
@@ -6,12 +6,55 @@ load_dotenv()
 
 class Config:
     DATABASE_URI = os.environ.get("DB_URL", "sqlite:///mhc.sqlite3")
+    DB_ECHO = os.environ.get("DB_ECHO", "false").lower() == "true"
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+    DB_POOL_PRE_PING = os.environ.get(
+        "DB_POOL_PRE_PING", "true").lower() == "true"
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+    # Comma separated read replica urls, read-only sessions use these
+    DATABASE_REPLICA_URIS = [
+        uri.strip() for uri in os.environ.get("DB_REPLICA_URLS", "").split(",")
+        if uri.strip()
+    ]
+    DB_REPLICA_HEALTH_INTERVAL = float(
+        os.environ.get("DB_REPLICA_HEALTH_INTERVAL", 10))
+    # Reads of a user who wrote within this window go to the primary
+    DB_READ_YOUR_WRITES_SECONDS = float(
+        os.environ.get("DB_READ_YOUR_WRITES_SECONDS", 5))
     SECRET_KEY = os.environ.get("SECRET_KEY", 'development')
     DEBUG = bool(os.environ.get('DEBUG', 1))
     BCRYPT_SALT = int(os.environ.get('BCRYPT_SALT', 14))
+    # Password hashing runs in a process pool; requests beyond the pending
+    # limit get a 429
+    BCRYPT_WORKERS = int(
+        os.environ.get("BCRYPT_WORKERS", os.cpu_count() or 2))
+    BCRYPT_MAX_PENDING = int(
+        os.environ.get("BCRYPT_MAX_PENDING", 4 * BCRYPT_WORKERS))
     ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRATION_MINUTES = 50
     REFRESH_TOKEN_EXPIRATION_DAYS = 30
+    # Blacklisted refresh tokens are screened by a per-worker Bloom filter
+    BLACKLIST_BLOOM_CAPACITY = int(
+        os.environ.get("BLACKLIST_BLOOM_CAPACITY", 100000))
+    BLACKLIST_BLOOM_ERROR_RATE = float(
+        os.environ.get("BLACKLIST_BLOOM_ERROR_RATE", 0.001))
+    # How often a worker picks up tokens blacklisted by the others
+    BLACKLIST_REFRESH_SECONDS = float(
+        os.environ.get("BLACKLIST_REFRESH_SECONDS", 5))
+    # Rebuilds drop the digests of purged, expired rows
+    BLACKLIST_REBUILD_SECONDS = float(
+        os.environ.get("BLACKLIST_REBUILD_SECONDS", 60 * 60))
+    # Expired tokens and blacklist rows are deleted in the background, in
+    # batches of TOKEN_PURGE_BATCH_SIZE
+    TOKEN_PURGE_ENABLED = os.environ.get(
+        "TOKEN_PURGE_ENABLED", "true").lower() == "true"
+    TOKEN_PURGE_INTERVAL_SECONDS = float(
+        os.environ.get("TOKEN_PURGE_INTERVAL_SECONDS", 60 * 60))
+    TOKEN_PURGE_BATCH_SIZE = int(
+        os.environ.get("TOKEN_PURGE_BATCH_SIZE", 1000))
+    TOKEN_PURGE_BATCH_PAUSE_SECONDS = float(
+        os.environ.get("TOKEN_PURGE_BATCH_PAUSE_SECONDS", 0.05))
     PORT = int(os.environ.get("PORT", 8000))
     HF_TOKEN = os.environ.get("HF_TOKEN", 8000)
 
@@ -21,6 +64,85 @@ class Config:
     EMAIL_PORT = int(os.environ.get("EMAIL_PORT", 465))
 
     SENTIMENT_MODEL = "SamLowe/roberta-base-go_emotions"
+    # torch (fp32), int8 (dynamically quantized) or onnx (ONNX Runtime)
+    SENTIMENT_BACKEND = os.environ.get("SENTIMENT_BACKEND", "torch")
+    SENTIMENT_ONNX_DIR = os.environ.get(
+        "SENTIMENT_ONNX_DIR", "models/go_emotions_onnx")
+    GENERATOR_BASE_MODEL = "mistralai/Mistral-7B-Instruct-v0.2"
+    GENERATOR_ADAPTER = \
+        "GRMenon/mental-health-mistral-7b-instructv0.2-finetuned-V2"
+    # Generator used on nodes without a CUDA GPU
+    GENERATOR_CPU_ENABLED = os.environ.get(
+        "GENERATOR_CPU_ENABLED", "false").lower() == "true"
+    GENERATOR_CPU_MODEL = os.environ.get(
+        "GENERATOR_CPU_MODEL", GENERATOR_BASE_MODEL)
+    # Merged into the CPU model weights, set empty for a non Mistral model
+    GENERATOR_CPU_ADAPTER = os.environ.get(
+        "GENERATOR_CPU_ADAPTER", GENERATOR_ADAPTER)
+    # int8 (torch dynamic quantization) or none
+    GENERATOR_CPU_QUANTIZATION = os.environ.get(
+        "GENERATOR_CPU_QUANTIZATION", "int8")
+    GENERATOR_CPU_THREADS = int(os.environ.get("GENERATOR_CPU_THREADS", 0))
+    # Load models in a background thread at startup instead of first use
+    PRELOAD_MODELS = os.environ.get(
+        "PRELOAD_MODELS", "true").lower() == "true"
+    GENERATION_MAX_NEW_TOKENS = int(
+        os.environ.get("GENERATION_MAX_NEW_TOKENS", 150))
+    # End generation at the first sentence end after this many tokens
+    GENERATION_STOP_AT_SENTENCE = os.environ.get(
+        "GENERATION_STOP_AT_SENTENCE", "true").lower() == "true"
+    GENERATION_SENTENCE_MIN_TOKENS = int(
+        os.environ.get("GENERATION_SENTENCE_MIN_TOKENS", 60))
+    # Token budget for the chat history sent with a new prompt
+    CHAT_CONTEXT_TOKENS = int(os.environ.get("CHAT_CONTEXT_TOKENS", 2048))
+    CHAT_CONTEXT_MAX_TURNS = int(
+        os.environ.get("CHAT_CONTEXT_MAX_TURNS", 20))
+    # Reuse each chat's past_key_values across turns
+    PREFIX_CACHE_ENABLED = os.environ.get(
+        "PREFIX_CACHE_ENABLED", "true").lower() == "true"
+    PREFIX_CACHE_MAX_MB = int(os.environ.get("PREFIX_CACHE_MAX_MB", 1024))
+    # Serve cached responses to near-identical first prompts
+    SEMANTIC_CACHE_ENABLED = os.environ.get(
+        "SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_MODEL = os.environ.get(
+        "SEMANTIC_CACHE_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    SEMANTIC_CACHE_THRESHOLD = float(
+        os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.92))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(
+        os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 5000))
+    SEMANTIC_CACHE_TTL_SECONDS = int(
+        os.environ.get("SEMANTIC_CACHE_TTL_SECONDS", 24 * 60 * 60))
+    # Concurrent chat prompts are generated together in one batch
+    GENERATION_MAX_BATCH_SIZE = int(
+        os.environ.get("GENERATION_MAX_BATCH_SIZE", 8))
+    GENERATION_MAX_WAIT_MS = float(
+        os.environ.get("GENERATION_MAX_WAIT_MS", 25))
+    # Concurrent sentiment classifications are scored in one pipeline call
+    SENTIMENT_MAX_BATCH_SIZE = int(
+        os.environ.get("SENTIMENT_MAX_BATCH_SIZE", 32))
+    SENTIMENT_MAX_WAIT_MS = float(
+        os.environ.get("SENTIMENT_MAX_WAIT_MS", 5))
+    # Mood trends are memoized per user until a new prompt is scored
+    TRENDS_CACHE_TTL_SECONDS = int(
+        os.environ.get("TRENDS_CACHE_TTL_SECONDS", 10 * 60))
+    TRENDS_CACHE_MAX_USERS = int(
+        os.environ.get("TRENDS_CACHE_MAX_USERS", 1024))
+    # Authorize access tokens from their signed claims, without a DB read;
+    # revoked sessions stop at the next refresh
+    STATELESS_AUTH = os.environ.get(
+        "STATELESS_AUTH", "false").lower() == "true"
+    # Authenticated users are cached per worker, keyed by id
+    USER_CACHE_ENABLED = os.environ.get(
+        "USER_CACHE_ENABLED", "true").lower() == "true"
+    USER_CACHE_TTL_SECONDS = float(
+        os.environ.get("USER_CACHE_TTL_SECONDS", 60))
+    USER_CACHE_MAX_ENTRIES = int(
+        os.environ.get("USER_CACHE_MAX_ENTRIES", 10000))
+    # Optional redis pub/sub shared by the workers, carries user cache
+    # invalidations and blacklisted tokens
+    BROADCAST_REDIS_URL = os.environ.get("BROADCAST_REDIS_URL")
+    BROADCAST_CHANNEL = os.environ.get("BROADCAST_CHANNEL", "mhc:broadcast")
+
     CLOUDINARY_CLOUD_NAME = os.environ.get("CLOUDINARY_CLOUD_NAME")
     CLOUDINARY_API_KEY = os.environ.get("CLOUDINARY_API_KEY")
     CLOUDINARY_API_SECRET = os.environ.get("CLOUDINARY_API_SECRET")
@@ -4,7 +4,9 @@ from pydantic import BaseModel, Field
 
 from src.services.auth import oauth2_scheme
 from src.utils import CustomError
+from src.config import Config
 from src.services.auth import AuthService
+from src.services.user_cache import user_cache
 from src.models.user import UserSchema
 
 
@@ -28,10 +30,23 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
     if not valid:
         raise credentials_exception
 
+    if Config.STATELESS_AUTH:
+        claims_user = AuthService.user_from_claims(payload)
+        if claims_user is not None:
+            return claims_user
+
     id = payload.get("id")
     token_data = TokenData(id=id)
 
-    user = AuthService.get_user_by_id(token_data.id)
+    user = user_cache.get(token_data.id)
+    if user is None:
+        generation = user_cache.generation
+        # A cached user must come from the primary: after another
+        # worker's invalidation a replica may still have the old row
+        user = await AuthService.get_user_by_id_async(
+            token_data.id, read_only=not user_cache.enabled)
+        if user is not None:
+            user_cache.set(user, generation)
 
     if user is None:
         raise credentials_exception
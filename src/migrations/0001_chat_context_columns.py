@@ -0,0 +1,11 @@
+"""Token counts on prompts and the per-chat semantic cache switch."""
+from src.migrations import add_column, sql_true
+
+
+def upgrade(connection):
+    add_column(connection, "prompts", "prompt_token_count", "INTEGER")
+    add_column(connection, "prompts", "response_token_count", "INTEGER")
+    add_column(
+        connection, "chats", "semantic_cache_enabled",
+        f"BOOLEAN DEFAULT {sql_true(connection)}"
+    )
@@ -0,0 +1,20 @@
+"""Indexes for the chat, prompt, sentiment and resource queries.
+
+The unique index on resources.description (a Text column) is dropped,
+it only added write overhead.
+"""
+from src.migrations import create_index, drop_index
+
+
+def upgrade(connection):
+    create_index(connection, "ix_chats_owner_id_created_at_id",
+                 "chats", ["owner_id", "created_at", "id"])
+    create_index(connection, "ix_prompts_chat_id_created_at_id",
+                 "prompts", ["chat_id", "created_at", "id"])
+    create_index(connection, "ix_sentiments_prompt_id_created_at",
+                 "sentiments", ["prompt_id", "created_at"])
+    create_index(connection, "ix_sentiments_created_at",
+                 "sentiments", ["created_at"])
+    create_index(connection, "ix_resources_created_at_id",
+                 "resources", ["created_at", "id"])
+    drop_index(connection, "ix_resources_description")
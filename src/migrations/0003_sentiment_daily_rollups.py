@@ -0,0 +1,42 @@
+"""Daily per-user sentiment rollups, backfilled from existing rows.
+
+The SQL is inlined so later changes to the model or the rollup service
+do not change what this migration does.
+"""
+from sqlalchemy import text
+
+from src.migrations import create_index
+
+
+def upgrade(connection):
+    id_type = "INTEGER" if connection.dialect.name == "sqlite" \
+        else "SERIAL"
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS sentiment_daily_rollups ("
+        f"id {id_type} NOT NULL PRIMARY KEY, "
+        "user_id INTEGER NOT NULL REFERENCES users (id), "
+        "day DATE NOT NULL, "
+        "sentiment VARCHAR(40) NOT NULL, "
+        "count INTEGER NOT NULL, "
+        "score_sum FLOAT NOT NULL, "
+        "score_max FLOAT NOT NULL)"
+    ))
+    create_index(connection,
+                 "ux_sentiment_daily_rollups_user_id_day_sentiment",
+                 "sentiment_daily_rollups", ["user_id", "day", "sentiment"],
+                 unique=True)
+
+    connection.execute(text("DELETE FROM sentiment_daily_rollups"))
+    connection.execute(text(
+        "INSERT INTO sentiment_daily_rollups "
+        "(user_id, day, sentiment, count, score_sum, score_max) "
+        "SELECT chats.owner_id, date(sentiments.created_at), "
+        "sentiments.sentiment, count(sentiments.id), "
+        "sum(sentiments.score), max(sentiments.score) "
+        "FROM sentiments "
+        "JOIN prompts ON prompts.id = sentiments.prompt_id "
+        "JOIN chats ON chats.id = prompts.chat_id "
+        "WHERE chats.owner_id IS NOT NULL "
+        "GROUP BY chats.owner_id, date(sentiments.created_at), "
+        "sentiments.sentiment"
+    ))
@@ -0,0 +1,11 @@
+"""Packed float16 vector of every emotion score on each prompt."""
+from sqlalchemy import LargeBinary
+
+from src.migrations import add_column
+
+
+def upgrade(connection):
+    add_column(
+        connection, "prompts", "emotion_scores",
+        LargeBinary().compile(dialect=connection.dialect)
+    )
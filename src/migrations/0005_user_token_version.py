@@ -0,0 +1,7 @@
+"""Per-user token version, bumped to revoke issued tokens."""
+from src.migrations import add_column
+
+
+def upgrade(connection):
+    add_column(
+        connection, "users", "token_version", "INTEGER NOT NULL DEFAULT 0")
@@ -0,0 +1,54 @@
+"""Blacklisted tokens are stored as sha256 digests.
+
+Existing rows have their token replaced by its digest and their
+expires_at set from the token's exp claim. The column keeps its name,
+the model maps it as `token_hash`.
+"""
+import hashlib
+from datetime import datetime
+
+from jose import jwt
+from sqlalchemy import bindparam, column, select, table, update
+
+
+token_blacklists = table(
+    "token_blacklists",
+    column("id"),
+    column("token"),
+    column("expires_at"),
+)
+
+
+def _expires_at(token: str, default: datetime) -> datetime:
+    try:
+        return datetime.utcfromtimestamp(
+            jwt.get_unverified_claims(token)["exp"])
+    except Exception:
+        return default
+
+
+def upgrade(connection):
+    # Digests are hex, only the JWTs stored so far contain dots
+    rows = connection.execute(
+        select(token_blacklists.c.id, token_blacklists.c.token,
+               token_blacklists.c.expires_at)
+        .where(token_blacklists.c.token.like("%.%"))
+    ).all()
+    if not rows:
+        return
+
+    connection.execute(
+        update(token_blacklists)
+        .where(token_blacklists.c.id == bindparam("row_id"))
+        .values(token=bindparam("token_hash"),
+                expires_at=bindparam("token_expires_at")),
+        [
+            {
+                "row_id": row.id,
+                "token_hash": hashlib.sha256(
+                    row.token.encode("utf-8")).hexdigest(),
+                "token_expires_at": _expires_at(row.token, row.expires_at)
+            }
+            for row in rows
+        ]
+    )
@@ -0,0 +1,9 @@
+"""Indexes on the token expiries, scanned by the background purge."""
+from src.migrations import create_index
+
+
+def upgrade(connection):
+    create_index(connection, "ix_tokens_expires_at",
+                 "tokens", ["expires_at"])
+    create_index(connection, "ix_token_blacklists_expires_at",
+                 "token_blacklists", ["expires_at"])
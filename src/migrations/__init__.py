@@ -0,0 +1,81 @@
+"""Schema migrations applied on top of `Base.metadata.create_all`.
+
+Each module named `NNNN_description.py` in this package defines
+`upgrade(connection)`. Modules run in name order and the applied ones
+are recorded in the `schema_migrations` table. Migrations must be
+idempotent: on a fresh database `create_all` has already built the
+latest schema and every migration is simply recorded.
+"""
+import importlib
+import pkgutil
+from datetime import datetime
+
+from sqlalchemy import (
+    Column, DateTime, MetaData, String, Table, inspect, select, text
+)
+
+from src.utils.logger import logger
+
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", String(100), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def available_migrations():
+    return sorted(
+        module.name for module in pkgutil.iter_modules(__path__)
+        if module.name[:4].isdigit()
+    )
+
+
+def run_migrations(engine) -> list:
+    """Applies pending migrations, each in its own transaction."""
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        applied = set(connection.execute(
+            select(schema_migrations.c.version)).scalars())
+
+    newly_applied = []
+    for version in available_migrations():
+        if version in applied:
+            continue
+        module = importlib.import_module(f"{__name__}.{version}")
+        with engine.begin() as connection:
+            module.upgrade(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, applied_at=datetime.utcnow()))
+        logger.info(f"::> Applied migration {version}")
+        newly_applied.append(version)
+    return newly_applied
+
+
+# Helpers for migration modules
+def has_column(connection, table: str, column: str) -> bool:
+    columns = inspect(connection).get_columns(table)
+    return column in {existing["name"] for existing in columns}
+
+
+def add_column(connection, table: str, column: str, ddl_type: str):
+    if not has_column(connection, table, column):
+        connection.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def create_index(connection, name: str, table: str, columns: list,
+                 unique: bool = False):
+    connection.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} "
+        f"ON {table} ({', '.join(columns)})"
+    ))
+
+
+def drop_index(connection, name: str):
+    connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+def sql_true(connection) -> str:
+    return "1" if connection.dialect.name == "sqlite" else "true"
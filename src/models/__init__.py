@@ -1,27 +1,220 @@
+import itertools
+import threading
+import time
+
 from sqlalchemy.orm import mapped_column, Mapped
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import Session
-from transformers import pipeline
-from transformers import AutoModelForCausalLM, AutoTokenizer
-from peft import PeftConfig, PeftModel
-import torch
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
 from src.config import Config
+from src.utils.logger import logger
 
 
 class Base(DeclarativeBase):
     id: Mapped[int] = mapped_column(primary_key=True)
 
 
-engine = create_engine(Config.DATABASE_URI, echo=True)
+def engine_options(uri: str) -> dict:
+    options = {
+        "echo": Config.DB_ECHO,
+        "pool_pre_ping": Config.DB_POOL_PRE_PING,
+        "pool_recycle": Config.DB_POOL_RECYCLE,
+    }
+    # SQLite pools are per file/thread, sizing only applies to servers
+    if not uri.startswith("sqlite"):
+        options["pool_size"] = Config.DB_POOL_SIZE
+        options["max_overflow"] = Config.DB_MAX_OVERFLOW
+    return options
+
+
+def async_database_uri(uri: str) -> str:
+    """Maps a sync database url to its asyncio driver."""
+    (scheme, rest) = uri.split("://", 1)
+    if scheme.startswith("sqlite"):
+        return f"sqlite+aiosqlite://{rest}"
+    if scheme.startswith("postgres"):
+        return f"postgresql+asyncpg://{rest}"
+    return uri
+
+
+engine = create_engine(
+    Config.DATABASE_URI, **engine_options(Config.DATABASE_URI))
+_async_engine = None
+
+
+def get_async_engine():
+    """Creates the async engine on first use, so the async drivers are
+    only required by code paths that use them."""
+    global _async_engine
+    if _async_engine is None:
+        uri = async_database_uri(Config.DATABASE_URI)
+        _async_engine = create_async_engine(uri, **engine_options(uri))
+    return _async_engine
+
+
+class ReplicaRouter:
+    """Picks the database a session reads from.
+
+    Read-only sessions go to the replicas round-robin. A background
+    thread runs `SELECT 1` on every replica each `health_interval`
+    seconds and unhealthy replicas are skipped; with no healthy replica
+    reads fall back to the primary. Users who wrote within the last
+    `read_your_writes_seconds` read from the primary, so they see their
+    own writes despite replication lag. Writes are tracked per process.
+    """
+
+    def __init__(
+        self,
+        replica_uris=Config.DATABASE_REPLICA_URIS,
+        health_interval: float = Config.DB_REPLICA_HEALTH_INTERVAL,
+        read_your_writes_seconds: float = Config.DB_READ_YOUR_WRITES_SECONDS
+    ):
+        self.replica_uris = list(replica_uris)
+        self.replicas = [
+            create_engine(uri, **engine_options(uri)) for uri in replica_uris
+        ]
+        self.healthy = [True] * len(self.replicas)
+        self.health_interval = health_interval
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._async_replicas = [None] * len(self.replicas)
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._recent_writers = {}
+        self._health_lock = threading.Lock()
+        self._health_thread = None
+
+    def check_health(self):
+        for (index, replica) in enumerate(self.replicas):
+            try:
+                with replica.connect() as connection:
+                    connection.execute(text("SELECT 1"))
+                healthy = True
+            except Exception as E:
+                healthy = False
+                if self.healthy[index]:
+                    logger.error(f"::> Read replica {index} is down: {E}")
+            if healthy and not self.healthy[index]:
+                logger.info(f"::> Read replica {index} is back up")
+            self.healthy[index] = healthy
+
+    def _watch_health(self):
+        while True:
+            time.sleep(self.health_interval)
+            self.check_health()
+
+    def _start_health_checks(self):
+        with self._health_lock:
+            if self._health_thread is None:
+                # Replicas down at boot must not be routed to until the
+                # first periodic check; requests wait for this one
+                self.check_health()
+                self._health_thread = threading.Thread(
+                    target=self._watch_health,
+                    name="replica-health",
+                    daemon=True
+                )
+                self._health_thread.start()
+
+    def record_write(self, user_id: int):
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writers[user_id] = now
+            if len(self._recent_writers) > 10000:
+                cutoff = now - self.read_your_writes_seconds
+                self._recent_writers = {
+                    user: at for (user, at) in self._recent_writers.items()
+                    if at > cutoff
+                }
+
+    def wrote_recently(self, user_id: int) -> bool:
+        with self._lock:
+            wrote_at = self._recent_writers.get(user_id)
+        return wrote_at is not None and \
+            time.monotonic() - wrote_at < self.read_your_writes_seconds
+
+    def replica_index(self, user_id: int = None):
+        """Index of the replica to read from, None for the primary."""
+        if not self.replicas:
+            return None
+        if user_id is not None and self.wrote_recently(user_id):
+            return None
+
+        self._start_health_checks()
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            index = (start + offset) % len(self.replicas)
+            if self.healthy[index]:
+                return index
+        return None
+
+    def read_engine(self, user_id: int = None):
+        index = self.replica_index(user_id)
+        return engine if index is None else self.replicas[index]
+
+    def async_read_engine(self, user_id: int = None):
+        index = self.replica_index(user_id)
+        if index is None:
+            return get_async_engine()
+        with self._lock:
+            if self._async_replicas[index] is None:
+                uri = async_database_uri(self.replica_uris[index])
+                self._async_replicas[index] = create_async_engine(
+                    uri, **engine_options(uri))
+            return self._async_replicas[index]
+
+    def status(self) -> list:
+        return [
+            {"replica": index, "healthy": healthy}
+            for (index, healthy) in enumerate(self.healthy)
+        ]
+
+
+replica_router = ReplicaRouter()
+
+
+def _written_user_ids(session) -> set:
+    user_ids = set()
+    if session.info.get("user_id") is not None:
+        user_ids.add(session.info["user_id"])
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if type(instance).__tablename__ == "users":
+            user_ids.add(instance.id)
+        elif getattr(instance, "owner_id", None) is not None:
+            user_ids.add(instance.owner_id)
+    return user_ids
+
+
+@event.listens_for(Session, "before_flush")
+def _reject_read_only_writes(session, flush_context, instances):
+    if session.info.get("read_only") and \
+            (session.new or session.dirty or session.deleted):
+        raise Exception("Cannot write in a read-only database session")
+
+
+@event.listens_for(Session, "after_flush")
+def _record_writes(session, flush_context):
+    for user_id in _written_user_ids(session):
+        replica_router.record_write(user_id)
 
 
 class DatabaseSession:
-    def withSession(self):
+    def withSession(self, read_only: bool = False, user_id: int = None):
+        """Opens a session on the primary, or on a read replica.
+
+        Args:
+            read_only: Route to a healthy read replica when one is
+                configured and the user has not written recently
+            user_id: User the session acts for, enables read-your-writes
+        """
         class SessionContextManager:
             def __enter__(self):
-                self.session = Session(engine)
+                self.session = Session(
+                    replica_router.read_engine(user_id)
+                    if read_only else engine,
+                    info={"read_only": read_only, "user_id": user_id}
+                )
                 return self.session
 
             def __exit__(self, exc_type, exc_value, traceback):
@@ -34,36 +227,23 @@ class DatabaseSession:
         return SessionContextManager()
 
 
-text_classifier = pipeline(
-    task="text-classification",
-    model=Config.SENTIMENT_MODEL, top_k=None
-)
-base_model = "mistralai/Mistral-7B-Instruct-v0.2"
-adapter = "GRMenon/mental-health-mistral-7b-instructv0.2-finetuned-V2"
-
-# Load tokenizer
-tokenizer = AutoTokenizer.from_pretrained(
-    base_model,
-    add_bos_token=True,
-    trust_remote_code=True,
-    padding_side='left'
-)
-
-# Create peft model using base_model and finetuned adapter
-config = PeftConfig.from_pretrained(adapter)
-generator = None
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-try:
-    model = AutoModelForCausalLM.from_pretrained(
-        base_model,
-        load_in_4bit=True,
-        device_map='auto',
-        torch_dtype='auto'
-    )
-    generator = PeftModel.from_pretrained(model, adapter)
-    generator.to(device)
-    generator.eval()
-except Exception as E:
-    print("FAILED TO RUN MODEL", E)
-    pass
+class AsyncDatabaseSession:
+    def withSession(self, read_only: bool = False, user_id: int = None):
+        class AsyncSessionContextManager:
+            async def __aenter__(self):
+                self.session = AsyncSession(
+                    replica_router.async_read_engine(user_id)
+                    if read_only else get_async_engine(),
+                    expire_on_commit=False,
+                    info={"read_only": read_only, "user_id": user_id}
+                )
+                return self.session
+
+            async def __aexit__(self, exc_type, exc_value, traceback):
+                if exc_type:
+                    await self.session.rollback()
+                else:
+                    await self.session.commit()
+                await self.session.close()
+
+        return AsyncSessionContextManager()
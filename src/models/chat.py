@@ -2,25 +2,42 @@ from sqlalchemy.orm import mapped_column, Mapped, relationship
 from typing import List
 from sqlalchemy import (
     TIMESTAMP,
+    Boolean,
+    Date,
     ForeignKey,
+    Index,
     String,
     Float,
+    Integer,
+    LargeBinary,
     Text
 )
-from datetime import datetime
+from datetime import date, datetime
 
 from . import Base
-from src.schemas.chat import ChatSchema, PromptSchema, SentimentSchema
+from src.schemas.chat import (
+    ChatSchema,
+    PromptSchema,
+    SentimentSchema,
+    SentimentDailyRollupSchema
+)
 
 
 class Chat(Base):
     __tablename__ = "chats"
     __pydantic_model__ = ChatSchema
+    __table_args__ = (
+        # /chat/chats keyset pages
+        Index("ix_chats_owner_id_created_at_id",
+              "owner_id", "created_at", "id"),
+    )
     owner_id: Mapped[int] = mapped_column(
         ForeignKey("users.id"), nullable=True)
     owner: Mapped["User"] = relationship("User")
     title: Mapped[str] = mapped_column(String(40), nullable=False)
     prompts: Mapped[List["Prompt"]] = relationship()
+    semantic_cache_enabled: Mapped[bool] = mapped_column(
+        Boolean, default=True)
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
@@ -33,6 +50,11 @@ class Chat(Base):
 class Prompt(Base):
     __tablename__ = "prompts"
     __pydantic_model__ = PromptSchema
+    __table_args__ = (
+        # /chat/prompts keyset pages, chat history and sentiment joins
+        Index("ix_prompts_chat_id_created_at_id",
+              "chat_id", "created_at", "id"),
+    )
 
     chat_id: Mapped[int] = mapped_column(
         ForeignKey("chats.id"), nullable=True)
@@ -42,6 +64,11 @@ class Prompt(Base):
 
     prompt: Mapped[str] = mapped_column(Text)
     bot_response: Mapped[str] = mapped_column(Text)
+    # Cached so chat history is not re-tokenized on every turn
+    prompt_token_count: Mapped[int] = mapped_column(Integer, nullable=True)
+    response_token_count: Mapped[int] = mapped_column(Integer, nullable=True)
+    # Every go_emotions score packed as float16, see GO_EMOTIONS_LABELS
+    emotion_scores: Mapped[bytes] = mapped_column(LargeBinary, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
@@ -54,6 +81,12 @@ class Prompt(Base):
 class Sentiment(Base):
     __tablename__ = "sentiments"
     __pydantic_model__ = SentimentSchema
+    __table_args__ = (
+        # /chat/sentiments joins from prompts filtered by date
+        Index("ix_sentiments_prompt_id_created_at",
+              "prompt_id", "created_at"),
+        Index("ix_sentiments_created_at", "created_at"),
+    )
     prompt_id: Mapped[int] = mapped_column(
         ForeignKey("prompts.id"), nullable=True)
     prompt: Mapped["Prompt"] = relationship(
@@ -65,3 +98,22 @@ class Sentiment(Base):
         TIMESTAMP(timezone=True), default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), default=datetime.utcnow)
+
+
+class SentimentDailyRollup(Base):
+    """Per user, UTC day and emotion totals of the stored sentiments."""
+    __tablename__ = "sentiment_daily_rollups"
+    __pydantic_model__ = SentimentDailyRollupSchema
+    __table_args__ = (
+        Index("ux_sentiment_daily_rollups_user_id_day_sentiment",
+              "user_id", "day", "sentiment", unique=True),
+    )
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id"), nullable=False)
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    sentiment: Mapped[str] = mapped_column(String(40), nullable=False)
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    score_sum: Mapped[float] = mapped_column(
+        Float, nullable=False, default=0)
+    score_max: Mapped[float] = mapped_column(
+        Float, nullable=False, default=0)
@@ -1,7 +1,7 @@
 from sqlalchemy.orm import mapped_column, Mapped
 from datetime import datetime
 from sqlalchemy import (
-    Text, DateTime, TIMESTAMP, String
+    Text, DateTime, TIMESTAMP, String, Index
 )
 from . import Base
 from src.schemas.resource import (
@@ -12,12 +12,16 @@ from src.schemas.resource import (
 class Resource(Base):
     __tablename__ = "resources"
     __pydantic_model__ = ResourceSchema
+    __table_args__ = (
+        # /resource/resources keyset pages
+        Index("ix_resources_created_at_id", "created_at", "id"),
+    )
     title: Mapped[str] = mapped_column(String(100), unique=True, index=True)
     thumbnail_url: Mapped[str] = mapped_column(
         String(100), unique=True, index=True)
     video_url: Mapped[str] = mapped_column(
         String(100), unique=True, index=True)
-    description: Mapped[str] = mapped_column(Text, unique=True, index=True)
+    description: Mapped[str] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
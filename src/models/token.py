@@ -1,5 +1,5 @@
 from sqlalchemy.orm import mapped_column, Mapped
-from sqlalchemy import Text, DateTime, TIMESTAMP, ForeignKey
+from sqlalchemy import String, Text, DateTime, TIMESTAMP, ForeignKey
 from datetime import datetime
 from sqlalchemy import Enum as SaEnum
 
@@ -14,12 +14,14 @@ from src.schemas.token import (
 class TokenBlacklist(Base):
     __tablename__ = "token_blacklists"
     __pydantic_model__ = TokenBlacklistSchema
-    token: Mapped[str] = mapped_column(Text, unique=True, index=True)
+    # sha256 hex digest of the token, tokens themselves are not stored
+    token_hash: Mapped[str] = mapped_column(
+        "token", String(64), unique=True, index=True)
     expires_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), nullable=True)
+        DateTime(timezone=True), nullable=True, index=True)
 
     def __repr__(self):
-        return f"<TokenBlacklist(token={self.token})>"
+        return f"<TokenBlacklist(token_hash={self.token_hash})>"
 
 
 class Token(Base):
@@ -32,4 +34,4 @@ class Token(Base):
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), default=datetime.utcnow)
     expires_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), nullable=False)
+        DateTime(timezone=True), nullable=False, index=True)
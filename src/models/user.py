@@ -1,5 +1,5 @@
 from sqlalchemy.orm import mapped_column, Mapped
-from sqlalchemy import String, TIMESTAMP, Text, Boolean
+from sqlalchemy import String, TIMESTAMP, Text, Boolean, Integer
 from datetime import datetime
 
 from . import Base
@@ -17,6 +17,9 @@ class User(Base):
     password: Mapped[str] = mapped_column(Text)
     active: Mapped[bool] = mapped_column(Boolean, default=True)
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False)
+    # Bumped to revoke every token issued to the user
+    token_version: Mapped[int] = mapped_column(
+        Integer, default=0, nullable=False)
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP(timezone=True), default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(
@@ -4,6 +4,7 @@ from src.views.user import user_routes
 from src.views.chat import chat_route
 from src.views.faq import faqs_router
 from src.views.resource import resources_router
+from src.views.export import export_router
 
 routes = APIRouter()
 
@@ -12,3 +13,4 @@ routes.include_router(user_routes)
 routes.include_router(chat_route)
 routes.include_router(faqs_router)
 routes.include_router(resources_router)
+routes.include_router(export_router)
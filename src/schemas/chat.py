@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from datetime import datetime
+from datetime import date, datetime
 
 
 class ChatSchema(BaseModel):
@@ -7,6 +7,7 @@ class ChatSchema(BaseModel):
     id: int
     title: str
     owner_id: int = Field(nullable=False)
+    semantic_cache_enabled: bool = Field(default=True)
     created_at: datetime = Field(nullable=False)
     updated_at: datetime = Field(nullable=False)
 
@@ -29,3 +30,23 @@ class SentimentSchema(BaseModel):
     sentiment: str = Field(default=[])
     created_at: datetime = Field(nullable=False)
     updated_at: datetime = Field(nullable=False)
+
+
+class SentimentDailyRollupSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True, extra='allow')
+    id: int
+    user_id: int = Field(nullable=False)
+    day: date = Field(nullable=False)
+    sentiment: str = Field(nullable=False)
+    count: int = Field(nullable=False)
+    score_sum: float = Field(nullable=False)
+    score_max: float = Field(nullable=False)
+
+
+class SentimentAggregateSchema(BaseModel):
+    model_config = ConfigDict(from_attributes=True, extra='allow')
+    bucket: date = Field(nullable=False)
+    sentiment: str = Field(nullable=False)
+    count: int = Field(nullable=False)
+    mean_score: float = Field(nullable=False)
+    max_score: float = Field(nullable=False)
@@ -6,7 +6,7 @@ from enum import Enum
 class TokenBlacklistSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True, extra='allow')
     id: int
-    token: str
+    token_hash: str
     expires_at: datetime = Field(nullable=True)
 
 
@@ -14,6 +14,7 @@ class UserSchema(BaseModel):
     email: str = Field(nullable=False)
     password: str = Field(nullable=False)
     is_admin: bool = Field(default=False)
+    token_version: int = Field(default=0)
     created_at: datetime = Field(nullable=False)
     updated_at: datetime = Field(nullable=False)
 
@@ -21,3 +22,14 @@ class UserSchema(BaseModel):
 class UserPublicSchema(UserSchema):
     id: int = Field(exclude=True)
     password: str = Field(nullable=False, exclude=True)
+    token_version: int = Field(default=0, exclude=True)
+
+
+class UserClaimsSchema(BaseModel):
+    """The user as signed into an access token, see STATELESS_AUTH."""
+    id: int
+    email: str = Field(nullable=False)
+    active: bool = Field(default=True)
+    is_email_verified: bool = Field(default=False)
+    is_admin: bool = Field(default=False)
+    token_version: int = Field(default=0)
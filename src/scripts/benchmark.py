@@ -0,0 +1,601 @@
+"""CPU benchmarks for the inference and database paths.
+
+Run with `python -m src.scripts.benchmark <name> [options]`.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.metrics import metrics
+
+
+TINY_CHAT_TEMPLATE = (
+    "{% for message in messages %}"
+    "{{ message['role'] }}: {{ message['content'] }}\n"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}assistant:{% endif %}"
+)
+
+
+def load_tiny_causal_lm(model_id: str):
+    """Loads a small causal LM and tokenizer usable in place of Mistral."""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_id, padding_side='left')
+    if tokenizer.chat_template is None:
+        tokenizer.chat_template = TINY_CHAT_TEMPLATE
+    model = AutoModelForCausalLM.from_pretrained(model_id)
+    model.eval()
+    return tokenizer, model
+
+
+def benchmark_generation(args):
+    from src.services.generation import GenerationScheduler
+
+    tokenizer, model = load_tiny_causal_lm(args.model)
+    conversations = [
+        [{"role": "user", "content": f"I feel anxious about exam {i}"}]
+        for i in range(args.requests)
+    ]
+
+    for max_batch_size in (1, args.batch_size):
+        metrics.reset()
+        name = f"generation_b{max_batch_size}"
+        scheduler = GenerationScheduler(
+            tokenizer=tokenizer,
+            generator=model,
+            device="cpu",
+            max_batch_size=max_batch_size,
+            max_wait_ms=args.wait_ms,
+            max_new_tokens=args.new_tokens,
+            min_new_tokens=args.new_tokens,
+            name=name
+        )
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.requests) as pool:
+            list(pool.map(scheduler.generate, conversations))
+        elapsed = time.perf_counter() - started
+
+        observations = metrics.snapshot()["observations"]
+        print(
+            f"max_batch_size={max_batch_size:<3} "
+            f"requests/s={args.requests / elapsed:8.2f} "
+            f"avg_batch={observations[f'{name}.batch_size']['avg']:6.2f} "
+            f"avg_queue_wait_ms="
+            f"{observations[f'{name}.queue_wait_ms']['avg']:9.2f} "
+            f"tokens/s="
+            f"{observations[f'{name}.tokens_per_second']['avg']:8.2f}"
+        )
+
+
+SAMPLE_PROMPTS = [
+    "I feel anxious about my exams next week",
+    "I could not sleep again last night and I am exhausted",
+    "Thank you, talking about it really helped",
+    "My friends keep ignoring my messages and it hurts",
+    "I am proud that I went for a run this morning",
+    "Nothing seems to matter anymore",
+    "I am so angry at my manager right now",
+    "I wonder if I should start seeing a therapist",
+]
+
+
+def _sample_texts(count: int):
+    return [
+        SAMPLE_PROMPTS[i % len(SAMPLE_PROMPTS)] for i in range(count)
+    ]
+
+
+def benchmark_sentiment(args):
+    from src.services.inference import model_registry
+    from src.services.sentiment import SentimentClassifier
+
+    texts = _sample_texts(args.texts)
+    text_classifier = model_registry.text_classifier
+
+    started = time.perf_counter()
+    for text in texts:
+        text_classifier([text])
+    unbatched = time.perf_counter() - started
+    print(f"batch=1              texts/s={len(texts) / unbatched:8.2f}")
+
+    classifier = SentimentClassifier(
+        text_classifier=text_classifier,
+        max_batch_size=args.batch_size,
+        max_wait_ms=args.wait_ms,
+        name="sentiment_bench"
+    )
+    started = time.perf_counter()
+    classifier.classify_many(texts, batch_size=args.batch_size)
+    batched = time.perf_counter() - started
+    print(f"classify_many={args.batch_size:<6} "
+          f"texts/s={len(texts) / batched:8.2f}")
+
+    metrics.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.batch_size) as pool:
+        list(pool.map(classifier.classify, texts))
+    concurrent = time.perf_counter() - started
+    observations = metrics.snapshot()["observations"]
+    print(f"classify concurrent  texts/s={len(texts) / concurrent:8.2f} "
+          f"avg_batch="
+          f"{observations['sentiment_bench.batch_size']['avg']:6.2f}")
+
+
+def benchmark_sentiment_backends(args):
+    """Latency, throughput and fp32 score parity for each backend."""
+    import numpy as np
+    from src.services.inference import build_text_classifier
+
+    texts = _sample_texts(args.texts)
+    reference = None
+    failures = []
+    for backend in args.backends:
+        text_classifier = build_text_classifier(backend)
+        text_classifier(texts[:1])
+
+        started = time.perf_counter()
+        for text in texts[:args.latency_texts]:
+            text_classifier([text])
+        latency_ms = (time.perf_counter() - started) \
+            * 1000 / args.latency_texts
+
+        started = time.perf_counter()
+        results = text_classifier(texts, batch_size=args.batch_size)
+        throughput = len(texts) / (time.perf_counter() - started)
+
+        # Scores in a fixed label order for comparison
+        scores = np.array([
+            [item["score"]
+             for item in sorted(result, key=lambda item: item["label"])]
+            for result in results
+        ])
+        line = (f"{backend:<6} latency_ms={latency_ms:8.2f} "
+                f"texts/s={throughput:8.2f}")
+        if reference is None:
+            reference = scores
+        else:
+            max_diff = float(np.abs(scores - reference).max())
+            top_match = float(np.mean(
+                scores.argmax(axis=1) == reference.argmax(axis=1)))
+            line += f" max_abs_diff={max_diff:.4f} top1_match={top_match:.2%}"
+            if max_diff > args.tolerance:
+                failures.append(backend)
+        print(line)
+
+    if failures:
+        raise SystemExit(
+            f"Scores differ from {args.backends[0]} by more than "
+            f"{args.tolerance}: {', '.join(failures)}")
+
+
+def benchmark_prefix_cache(args):
+    """Prefill time per turn with and without the chat prefix cache."""
+    import torch
+    from src.services.prefix_cache import PrefixCache
+
+    tokenizer, model = load_tiny_causal_lm(args.model)
+    cache = PrefixCache(max_bytes=args.max_mb * 1024 * 1024,
+                        min_reuse_tokens=1, name="prefix_cache_bench")
+    messages = []
+    full_total = cached_total = 0.0
+    for turn in range(args.turns):
+        messages.append({
+            "role": "user", "content": SAMPLE_PROMPTS[turn % 8]
+        })
+        prompt = tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True)
+        token_ids = tokenizer(
+            prompt, return_tensors='pt')["input_ids"]
+
+        with torch.no_grad():
+            started = time.perf_counter()
+            output = model(input_ids=token_ids, use_cache=True)
+            full = time.perf_counter() - started
+
+            (past_key_values, reused) = cache.lookup(0, token_ids[0])
+            started = time.perf_counter()
+            model(
+                input_ids=token_ids[:, reused:],
+                past_key_values=past_key_values,
+                use_cache=True
+            )
+            cached = time.perf_counter() - started
+
+        cache.store(0, token_ids[0], output.past_key_values)
+        full_total += full
+        cached_total += cached
+        print(f"turn={turn + 1:<3} prompt_tokens={token_ids.shape[-1]:<5} "
+              f"reused={reused:<5} full_ms={full * 1000:8.2f} "
+              f"cached_ms={cached * 1000:8.2f}")
+
+        messages.append({
+            "role": "assistant",
+            "content": "That sounds hard, tell me more about it. " * 4
+        })
+
+    print(f"total full_ms={full_total * 1000:.2f} "
+          f"cached_ms={cached_total * 1000:.2f}")
+
+
+def _replay_prompts(count: int, from_db: bool):
+    if not from_db:
+        return _sample_texts(count)
+
+    from src.models import DatabaseSession
+    from src.models.chat import Prompt
+
+    with DatabaseSession().withSession() as session:
+        rows = session.query(Prompt.prompt).order_by(
+            Prompt.id.desc()).limit(count).all()
+        return [row.prompt for row in rows]
+
+
+def benchmark_stopping(args):
+    """Tokens generated and kept per response with and without stopping
+    at a sentence boundary, replaying sample or stored prompts."""
+    from src.services.generation import GenerationScheduler
+
+    if args.model == "registry":
+        from src.services.inference import model_registry
+        tokenizer, model = model_registry.tokenizer, model_registry.generator
+    else:
+        tokenizer, model = load_tiny_causal_lm(args.model)
+    prompts = _replay_prompts(args.prompts, args.from_db)
+    conversations = [
+        ([{"role": "user", "content": prompt}], None) for prompt in prompts
+    ]
+
+    for stop_at_sentence in (False, True):
+        metrics.reset()
+        name = f"stopping_{stop_at_sentence}".lower()
+        scheduler = GenerationScheduler(
+            tokenizer=tokenizer,
+            generator=model,
+            device=model.device.type,
+            max_new_tokens=args.max_new_tokens,
+            stop_at_sentence=stop_at_sentence,
+            sentence_min_new_tokens=args.min_tokens,
+            prefix_cache=None,
+            name=name
+        )
+        responses = []
+        for start in range(0, len(conversations), args.batch_size):
+            responses += scheduler.generate_batch(
+                conversations[start:start + args.batch_size])
+
+        generated = metrics.snapshot()["counters"][f"{name}.tokens"]
+        kept = sum(
+            len(tokenizer.encode(response, add_special_tokens=False))
+            for response in responses
+        )
+        print(f"stop_at_sentence={str(stop_at_sentence):<5} "
+              f"generated/response={generated / len(prompts):7.2f} "
+              f"kept/response={kept / len(prompts):7.2f} "
+              f"discarded/response={(generated - kept) / len(prompts):7.2f}")
+
+
+def benchmark_load(args):
+    """Concurrent requests against a running server.
+
+    Compare a sync `def` endpoint with an `async def` one: sync handlers
+    stop scaling at the threadpool size (40 by default), async ones keep
+    going until the database pool is the limit.
+    """
+    import asyncio
+    import statistics
+    import httpx
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token \
+        else {}
+    latencies = []
+    errors = 0
+
+    async def worker(client, count):
+        nonlocal errors
+        for _ in range(count):
+            started = time.perf_counter()
+            response = await client.request(args.method, args.path)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    async def run():
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(
+            base_url=args.url, headers=headers, limits=limits,
+            timeout=60
+        ) as client:
+            per_worker = args.requests // args.concurrency
+            await asyncio.gather(*[
+                worker(client, per_worker) for _ in range(args.concurrency)
+            ])
+
+    started = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{args.method} {args.path} concurrency={args.concurrency} "
+          f"requests/s={len(latencies) / elapsed:8.2f} "
+          f"p50_ms={statistics.median(latencies) * 1000:8.2f} "
+          f"p95_ms={latencies[int(len(latencies) * 0.95)] * 1000:8.2f} "
+          f"errors={errors}")
+
+
+def benchmark_engine(path: str):
+    """A throwaway SQLite database with every table created."""
+    import os
+    from sqlalchemy import create_engine
+    from src.models import Base
+    import src.scripts.models  # noqa: F401 registers every model
+
+    if os.path.exists(path):
+        os.remove(path)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    return engine
+
+
+def _seed_prompts(session, chat_id: int, count: int):
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from src.models.chat import Prompt
+
+    started_at = datetime.utcnow() - timedelta(minutes=count)
+    session.execute(insert(Prompt), [
+        {
+            "chat_id": chat_id,
+            "prompt": SAMPLE_PROMPTS[i % 8],
+            "bot_response": "That sounds hard, tell me more about it.",
+            "created_at": started_at + timedelta(minutes=i),
+            "updated_at": started_at + timedelta(minutes=i),
+        }
+        for i in range(count)
+    ])
+    session.commit()
+
+
+def benchmark_pagination(args):
+    """Per-page cost of in-memory vs keyset pagination as history grows."""
+    from sqlalchemy.orm import Session
+    from src.models.chat import Chat, Prompt
+    from src.schemas.chat import PromptSchema
+    from src.utils.pagination import CursorParams, keyset_paginate
+
+    engine = benchmark_engine(args.database)
+    with Session(engine) as session:
+        chat = Chat(title="benchmark", owner_id=None)
+        session.add(chat)
+        session.commit()
+        seeded = 0
+        for total in args.sizes:
+            _seed_prompts(session, chat.id, total - seeded)
+            seeded = total
+            query = session.query(Prompt).where(Prompt.chat_id == chat.id)
+
+            started = time.perf_counter()
+            prompts = [PromptSchema.from_orm(prompt) for prompt in query]
+            prompts.reverse()
+            prompts[:args.size]
+            in_memory = time.perf_counter() - started
+
+            started = time.perf_counter()
+            page = keyset_paginate(
+                query, Prompt, PromptSchema, CursorParams(size=args.size))
+            first_page = time.perf_counter() - started
+
+            # Walk a few pages deep to time a page far from the head
+            for _ in range(args.depth):
+                page = keyset_paginate(query, Prompt, PromptSchema,
+                                       CursorParams(cursor=page.next_cursor,
+                                                    size=args.size))
+            started = time.perf_counter()
+            keyset_paginate(query, Prompt, PromptSchema, CursorParams(
+                cursor=page.next_cursor, size=args.size))
+            deep_page = time.perf_counter() - started
+
+            print(f"rows={total:<8} in_memory_ms={in_memory * 1000:9.2f} "
+                  f"keyset_first_ms={first_page * 1000:7.2f} "
+                  f"keyset_deep_ms={deep_page * 1000:7.2f}")
+
+
+def _legacy_save_turn(session, chat, prompt, response, sentiments):
+    """The previous /chat/prompt write path: one commit per row."""
+    from src.models.chat import Prompt, Sentiment
+
+    if chat.id is None:
+        session.add(chat)
+        session.commit()
+    prompt_orm = Prompt(chat_id=chat.id, prompt=prompt, bot_response=response)
+    session.add(prompt_orm)
+    session.commit()
+    for sentiment in sentiments:
+        if sentiment["score"] > 0.3:
+            session.add(Sentiment(prompt_id=prompt_orm.id,
+                                  score=sentiment["score"],
+                                  sentiment=sentiment["label"]))
+            session.commit()
+
+
+def benchmark_db_roundtrips(args):
+    """Statements, commits and latency of saving one chat turn."""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    from src.models.chat import Chat
+    from src.services.chat import ChatService
+
+    engine = benchmark_engine(args.database)
+    counts = {"statements": 0, "commits": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(*_):
+        counts["statements"] += 1
+
+    @event.listens_for(engine, "commit")
+    def count_commit(*_):
+        counts["commits"] += 1
+
+    sentiments = [
+        {"label": "sadness", "score": 0.61},
+        {"label": "nervousness", "score": 0.42},
+        {"label": "fear", "score": 0.35},
+    ]
+    write_paths = {
+        "per_row_commits": lambda session, chat: _legacy_save_turn(
+            session, chat, "prompt", "response", sentiments),
+        "single_transaction": lambda session, chat: ChatService.save_turn(
+            session, chat, "prompt", 2, "response", sentiments),
+    }
+    for (name, save_turn) in write_paths.items():
+        for new_chat in (True, False):
+            with Session(engine) as session:
+                chat = Chat(title="benchmark", owner_id=None)
+                session.add(chat)
+                session.commit()
+
+                counts.update(statements=0, commits=0)
+                started = time.perf_counter()
+                for _ in range(args.turns):
+                    if new_chat:
+                        chat = Chat(title="benchmark", owner_id=None)
+                    save_turn(session, chat)
+                elapsed = time.perf_counter() - started
+
+            print(f"{name:<20} new_chat={str(new_chat):<5} "
+                  f"statements/turn={counts['statements'] / args.turns:5.1f} "
+                  f"commits/turn={counts['commits'] / args.turns:4.1f} "
+                  f"ms/turn={elapsed * 1000 / args.turns:7.2f}")
+
+
+def benchmark_user_cache(args):
+    """Authenticated user resolution with and without the user cache.
+
+    Resolves `get_current_user` for an existing user against the
+    configured database. For end to end numbers run `load --path
+    /user/me` against servers started with USER_CACHE_ENABLED=false and
+    true.
+    """
+    import asyncio
+    from src.middlewares.auth import get_current_user
+    from src.services.auth import AuthService
+    from src.services.user_cache import user_cache
+
+    user = AuthService.get_user_by_email(args.email)
+    if user is None:
+        raise SystemExit(f"No user with email {args.email}")
+    token = AuthService.create_access_token(user)
+
+    async def resolve(count):
+        for _ in range(count):
+            await get_current_user(token)
+
+    async def run():
+        await asyncio.gather(*[
+            resolve(args.requests // args.concurrency)
+            for _ in range(args.concurrency)
+        ])
+
+    for enabled in (False, True):
+        user_cache.enabled = enabled
+        user_cache.clear()
+        metrics.reset()
+        started = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        stats = user_cache.stats()
+        print(f"cache={str(enabled):<5} concurrency={args.concurrency} "
+              f"requests/s={args.requests / elapsed:9.1f} "
+              f"hits={stats['hits']} misses={stats['misses']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    generation = subparsers.add_parser(
+        "generation", help="Batched vs unbatched chat generation")
+    generation.add_argument("--model", default="sshleifer/tiny-gpt2")
+    generation.add_argument("--requests", type=int, default=32)
+    generation.add_argument("--batch-size", type=int, default=8)
+    generation.add_argument("--wait-ms", type=float, default=25)
+    generation.add_argument("--new-tokens", type=int, default=32)
+    generation.set_defaults(run=benchmark_generation)
+
+    sentiment = subparsers.add_parser(
+        "sentiment", help="Sentiment throughput at batch=1 and batched")
+    sentiment.add_argument("--texts", type=int, default=256)
+    sentiment.add_argument("--batch-size", type=int, default=32)
+    sentiment.add_argument("--wait-ms", type=float, default=5)
+    sentiment.set_defaults(run=benchmark_sentiment)
+
+    backends = subparsers.add_parser(
+        "sentiment-backends",
+        help="Parity and speed of the torch, int8 and onnx backends")
+    backends.add_argument(
+        "--backends", nargs="+", default=["torch", "int8", "onnx"])
+    backends.add_argument("--texts", type=int, default=256)
+    backends.add_argument("--latency-texts", type=int, default=32)
+    backends.add_argument("--batch-size", type=int, default=32)
+    backends.add_argument("--tolerance", type=float, default=0.05)
+    backends.set_defaults(run=benchmark_sentiment_backends)
+
+    prefix = subparsers.add_parser(
+        "prefix-cache", help="Prefill time with and without KV reuse")
+    prefix.add_argument("--model", default="sshleifer/tiny-gpt2")
+    prefix.add_argument("--turns", type=int, default=20)
+    prefix.add_argument("--max-mb", type=int, default=256)
+    prefix.set_defaults(run=benchmark_prefix_cache)
+
+    stopping = subparsers.add_parser(
+        "stopping", help="Tokens saved by sentence-boundary stopping")
+    stopping.add_argument(
+        "--model", default="sshleifer/tiny-gpt2",
+        help="Model id, or 'registry' for the configured chat model")
+    stopping.add_argument("--prompts", type=int, default=32)
+    stopping.add_argument(
+        "--from-db", action="store_true",
+        help="Replay the latest stored prompts instead of samples")
+    stopping.add_argument("--batch-size", type=int, default=8)
+    stopping.add_argument("--max-new-tokens", type=int, default=150)
+    stopping.add_argument("--min-tokens", type=int, default=60)
+    stopping.set_defaults(run=benchmark_stopping)
+
+    load = subparsers.add_parser(
+        "load", help="Concurrent HTTP load against a running server")
+    load.add_argument("--url", default="http://localhost:8000")
+    load.add_argument("--path", default="/user/me")
+    load.add_argument("--method", default="GET")
+    load.add_argument("--token", help="Access token for protected routes")
+    load.add_argument("--concurrency", type=int, default=200)
+    load.add_argument("--requests", type=int, default=4000)
+    load.set_defaults(run=benchmark_load)
+
+    pagination = subparsers.add_parser(
+        "pagination", help="In-memory vs keyset pagination per page")
+    pagination.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    pagination.add_argument("--size", type=int, default=50)
+    pagination.add_argument("--depth", type=int, default=10)
+    pagination.add_argument("--database", default="benchmark.sqlite3")
+    pagination.set_defaults(run=benchmark_pagination)
+
+    roundtrips = subparsers.add_parser(
+        "db-roundtrips", help="Database round trips of saving a chat turn")
+    roundtrips.add_argument("--turns", type=int, default=200)
+    roundtrips.add_argument("--database", default="benchmark.sqlite3")
+    roundtrips.set_defaults(run=benchmark_db_roundtrips)
+
+    user_cache = subparsers.add_parser(
+        "user-cache", help="get_current_user with and without the cache")
+    user_cache.add_argument("--email", required=True)
+    user_cache.add_argument("--requests", type=int, default=2000)
+    user_cache.add_argument("--concurrency", type=int, default=20)
+    user_cache.set_defaults(run=benchmark_user_cache)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from src.models import DatabaseSession
 from src.models.user import User
+from src.services.user_cache import user_cache
 
 
 def create_admin():
@@ -14,3 +15,7 @@ def create_admin():
         session.commit()
 
         print(user_orm, "Is now an admin")
+
+    # Reaches the running workers only through BROADCAST_REDIS_URL,
+    # otherwise they pick the change up within USER_CACHE_TTL_SECONDS
+    user_cache.invalidate(user_orm.id)
@@ -0,0 +1,41 @@
+"""Exports chats, prompts and sentiments for analytics.
+
+    python -m src.scripts.export exports/ --format parquet
+    python -m src.scripts.export export.ndjson --format ndjson --user-id 1
+"""
+import argparse
+import time
+
+from src.services.export import EXPORT_BATCH_SIZE, ExportService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "output", help="Directory for parquet, file for ndjson")
+    parser.add_argument(
+        "--format", choices=["parquet", "ndjson"], default="parquet")
+    parser.add_argument(
+        "--user-id", type=int, default=None,
+        help="Only export this user's data")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.format == "parquet":
+        written = ExportService.write_parquet(
+            args.output, args.user_id, args.batch_size)
+        summary = " ".join(f"{table}={rows}" for table, rows
+                           in written.items())
+    else:
+        size = 0
+        with open(args.output, "wb") as file:
+            for chunk in ExportService.ndjson(args.user_id, args.batch_size):
+                file.write(chunk)
+                size += len(chunk)
+        summary = f"bytes={size}"
+    print(f"Exported {summary} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
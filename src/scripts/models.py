@@ -1,5 +1,11 @@
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
 from src.models import Base, engine
 from src.config import Config
+from src.migrations import run_migrations
 
 import src.models.user
 import src.models.token
@@ -10,9 +16,107 @@ import src.models.resource
 
 def create_tables():
     Base.metadata.create_all(engine)
+    run_migrations(engine)
 
 
 def drop_tables():
     if not Config.DEBUG:
         raise Exception("This script is only available in debug mode")
     Base.metadata.drop_all(engine)
+
+
+def backfill_rollups(user_id: int = None) -> int:
+    from src.services.sentiment_rollup import SentimentRollupService
+
+    with Session(engine) as session:
+        written = SentimentRollupService.backfill(session, user_id)
+        session.commit()
+    return written
+
+
+def hot_queries(session) -> dict:
+    """The queries behind the busiest endpoints, as the views build them."""
+    from src.services.chat import ChatService
+    from src.services.sentiment_rollup import SentimentRollupService
+    from src.models.chat import Chat, Prompt
+    from src.models.resource import Resource
+    from src.utils.pagination import encode_cursor, keyset_paginate_query
+
+    now = datetime.utcnow()
+    cursor = encode_cursor(now, 1)
+    return {
+        "chats page": keyset_paginate_query(
+            ChatService.chats_query(session, 1), Chat, cursor, 50),
+        "prompts page": keyset_paginate_query(
+            ChatService.prompts_query(session, 1), Prompt, cursor, 50),
+        "resources page": keyset_paginate_query(
+            session.query(Resource), Resource, cursor, 50),
+        "chat history": ChatService.history_query(session, 1),
+        "historical sentiments": ChatService.sentiments_query(
+            session, 1, now - timedelta(days=30), now),
+        "sentiment aggregates": SentimentRollupService.aggregate_query(
+            session, 1, (now - timedelta(days=365)).date(), now.date()),
+    }
+
+
+def check_query_plans(bind=engine) -> list:
+    """Asserts the hot queries are served by indexes on SQLite.
+
+    Returns the offending (query, plan step) pairs; a plan step that
+    scans a table or index instead of seeking it, or sorts in a
+    temporary b-tree, is a regression.
+    """
+    if bind.dialect.name != "sqlite":
+        raise Exception("Query plan checks run against SQLite")
+
+    failures = []
+    with Session(bind) as session:
+        for (name, query) in hot_queries(session).items():
+            compiled = query.statement.compile(dialect=bind.dialect)
+            parameters = tuple(
+                compiled.params[key] for key in compiled.positiontup)
+            plan = session.connection().exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {compiled}", parameters).all()
+            for step in plan:
+                detail = step[-1]
+                if detail.startswith("SCAN") or "TEMP B-TREE" in detail:
+                    failures.append((name, detail))
+    return failures
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "create"
+    if command == "create":
+        create_tables()
+    elif command == "migrate":
+        print("Applied:", run_migrations(engine) or "nothing")
+    elif command == "drop":
+        drop_tables()
+    elif command == "backfill-rollups":
+        user_id = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        print("Rollup rows written:", backfill_rollups(user_id))
+    elif command == "check-replicas":
+        from src.models import replica_router
+
+        replica_router.check_health()
+        for (uri, status) in zip(replica_router.replica_uris,
+                                 replica_router.status()):
+            print(f"{uri}: {'healthy' if status['healthy'] else 'down'}")
+        if not all(status["healthy"] for status in replica_router.status()):
+            sys.exit(1)
+    elif command == "purge-tokens":
+        from src.services.token_maintenance import token_maintenance
+
+        for (table, purged) in token_maintenance.run().items():
+            print(f"{table}: {purged} expired rows deleted")
+    elif command == "check-plans":
+        failures = check_query_plans()
+        for (name, detail) in failures:
+            print(f"{name}: {detail}")
+        if failures:
+            sys.exit(1)
+        print("All hot queries use indexes")
+    else:
+        sys.exit("Usage: python -m src.scripts.models [create|migrate|drop|"
+                 "backfill-rollups [user_id]|check-replicas|purge-tokens|"
+                 "check-plans]")
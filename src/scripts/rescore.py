@@ -0,0 +1,216 @@
+"""Re-scores the sentiments of every stored prompt.
+
+Run after changing SENTIMENT_MODEL (or the backend). Prompts are read in
+id order and classified in batches. Each batch's Sentiment rows and
+packed emotion vectors are replaced in one transaction, then the
+checkpoint file is updated, so an interrupted run resumes after the last
+committed batch; a run can only be resumed with the same model and
+backend.
+
+Daily rollups are rebuilt once every prompt is done. Until then,
+including while an interrupted run is not resumed, the aggregate
+endpoint reports the old scores while sentiments and trends report a
+mix of old and new ones.
+
+    python -m src.scripts.rescore --workers 4 --batch-size 512
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from sqlalchemy import delete, insert, select, update
+
+from src.config import Config
+from src.models import DatabaseSession
+from src.models.chat import Chat, Prompt, Sentiment
+from src.services.chat import ChatService
+from src.services.sentiment import pack_scores
+from src.services.sentiment_rollup import SentimentRollupService
+
+
+_worker_classifier = None
+
+
+def _init_worker(backend: str, threads: int):
+    """Loads a classifier per worker process, each on its own cores."""
+    global _worker_classifier
+    import torch
+    from src.services.inference import build_text_classifier
+
+    torch.set_num_threads(threads)
+    _worker_classifier = build_text_classifier(backend)
+
+
+def _score_in_worker(texts, batch_size: int):
+    return _worker_classifier(texts, batch_size=batch_size, truncation=True)
+
+
+class Scorer:
+    """Classifies texts in-process, or split across a process pool."""
+
+    def __init__(self, workers: int, backend: str, batch_size: int):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.pool = None
+        if workers > 1:
+            threads = max(1, (os.cpu_count() or workers) // workers)
+            self.pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(backend, threads)
+            )
+        else:
+            from src.services.inference import build_text_classifier
+            self.classifier = build_text_classifier(backend)
+
+    def score(self, texts):
+        if self.pool is None:
+            return self.classifier(
+                texts, batch_size=self.batch_size, truncation=True)
+
+        size = -(-len(texts) // self.workers)
+        chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+        results = []
+        for scores in self.pool.map(
+                _score_in_worker, chunks,
+                [min(size, self.batch_size)] * len(chunks)):
+            results.extend(scores)
+        return results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def read_checkpoint(path: str) -> dict:
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_checkpoint(path: str, checkpoint: dict):
+    # Replace atomically so a crash never leaves a truncated checkpoint
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def next_batch(session, after_id: int, size: int):
+    return session.execute(
+        select(Prompt.id, Prompt.prompt, Prompt.created_at, Chat.owner_id)
+        .join(Prompt.chat, isouter=True)
+        .where(Prompt.id > after_id)
+        .order_by(Prompt.id)
+        .limit(size)
+    ).all()
+
+
+def replace_scores(session, batch, results):
+    """Swaps a batch's sentiments and emotion vectors for new scores."""
+    prompt_ids = [row.id for row in batch]
+    session.execute(
+        delete(Sentiment).where(Sentiment.prompt_id.in_(prompt_ids)))
+
+    sentiment_rows = []
+    for (row, scores) in zip(batch, results):
+        sentiment_rows.extend(ChatService.sentiment_rows(
+            row.id, scores, row.created_at))
+    if sentiment_rows:
+        session.execute(insert(Sentiment), sentiment_rows)
+
+    # Bulk UPDATE by primary key, one executemany
+    session.execute(update(Prompt), [
+        {"id": row.id, "emotion_scores": pack_scores(scores)}
+        for (row, scores) in zip(batch, results)
+    ])
+    return len(sentiment_rows)
+
+
+def rescore(args):
+    checkpoint = None if args.restart else read_checkpoint(args.checkpoint)
+    if checkpoint and (checkpoint["model"], checkpoint.get("backend")) \
+            != (Config.SENTIMENT_MODEL, args.backend):
+        raise SystemExit(
+            f"{args.checkpoint} was written for {checkpoint['model']} "
+            f"({checkpoint.get('backend')}), pass --restart to re-score "
+            f"with {Config.SENTIMENT_MODEL} ({args.backend})")
+    checkpoint = checkpoint or {
+        "model": Config.SENTIMENT_MODEL,
+        "backend": args.backend,
+        "last_prompt_id": 0,
+        "prompts": 0,
+        "sentiments": 0,
+        "done": False,
+    }
+    if checkpoint["done"]:
+        print(f"Already done ({checkpoint['prompts']} prompts), "
+              "pass --restart to re-score again")
+        return
+
+    scorer = Scorer(args.workers, args.backend, args.batch_size)
+    started = time.perf_counter()
+    scored = 0
+    try:
+        while True:
+            batch_started = time.perf_counter()
+            with DatabaseSession().withSession() as session:
+                batch = next_batch(
+                    session, checkpoint["last_prompt_id"], args.batch_size)
+            if not batch:
+                break
+
+            # No transaction is held open while the batch is scored
+            results = scorer.score([row.prompt for row in batch])
+            with DatabaseSession().withSession() as session:
+                sentiments = replace_scores(session, batch, results)
+                session.commit()
+
+            checkpoint["last_prompt_id"] = batch[-1].id
+            checkpoint["prompts"] += len(batch)
+            checkpoint["sentiments"] += sentiments
+            write_checkpoint(args.checkpoint, checkpoint)
+
+            scored += len(batch)
+            batch_rate = len(batch) / (time.perf_counter() - batch_started)
+            rate = scored / (time.perf_counter() - started)
+            print(f"prompt_id<={batch[-1].id:<10} "
+                  f"batch_rows/s={batch_rate:8.1f} rows/s={rate:8.1f} "
+                  f"total={checkpoint['prompts']}")
+    finally:
+        scorer.close()
+
+    with DatabaseSession().withSession() as session:
+        rollups = SentimentRollupService.backfill(session)
+        session.commit()
+    checkpoint["done"] = True
+    write_checkpoint(args.checkpoint, checkpoint)
+
+    elapsed = time.perf_counter() - started
+    print(f"Re-scored {scored} prompts in {elapsed:.1f}s "
+          f"({scored / elapsed if elapsed else 0:.1f} rows/s), "
+          f"rebuilt {rollups} rollup rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="Prompts read, scored and written per batch")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Classifier processes, 1 scores in-process")
+    parser.add_argument("--backend", default=Config.SENTIMENT_BACKEND,
+                        choices=["torch", "int8", "onnx"])
+    parser.add_argument("--checkpoint", default="rescore.checkpoint.json")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore the checkpoint and start from the "
+                             "first prompt")
+    rescore(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
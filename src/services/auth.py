@@ -1,12 +1,16 @@
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timezone, timedelta
+from sqlalchemy import select, update
 from sqlalchemy.exc import NoResultFound
 from jose import jwt, JWTError
 
-import bcrypt
-from src.models import DatabaseSession
+from src.models import DatabaseSession, AsyncDatabaseSession
 from src.config import Config
 from src.models.user import User
+from src.schemas.user import UserClaimsSchema
+from src.services.password import password_hasher
+from src.services.user_cache import user_cache
+from src.utils import CustomError
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
@@ -15,23 +19,15 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 class AuthService:
     @staticmethod
     def make_hashed_password(password: str):
-        pwhash = bcrypt.hashpw(
-            password=password.encode("utf-8"),
-            salt=bcrypt.gensalt()
-        )
+        return password_hasher.hash(password)
 
-        return pwhash.decode("utf-8")
+    @staticmethod
+    async def make_hashed_password_async(password: str):
+        return await password_hasher.hash_async(password)
 
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str):
-        try:
-            return bcrypt.checkpw(
-                plain_password.encode("utf-8"),
-                hashed_password.encode("utf-8")
-            )
-        except Exception as E:
-            print(E)
-            return False
+        return password_hasher.verify(plain_password, hashed_password)
 
     @staticmethod
     def get_user_by_email(email: str) -> User.__pydantic_model__ or None:
@@ -48,7 +44,8 @@ class AuthService:
     @staticmethod
     def get_user_by_id(id: int) -> User.__pydantic_model__ or None:
         user = None
-        with DatabaseSession().withSession() as session:
+        with DatabaseSession().withSession(
+                read_only=True, user_id=id) as session:
             try:
                 user_model = session.query(User).where(
                     User.id == id).one()
@@ -57,6 +54,31 @@ class AuthService:
                 pass
         return user
 
+    @staticmethod
+    async def get_user_by_email_async(
+        email: str
+    ) -> User.__pydantic_model__ or None:
+        async with AsyncDatabaseSession().withSession() as session:
+            user_model = (await session.execute(
+                select(User).where(User.email == email)
+            )).scalar_one_or_none()
+            if user_model is None:
+                return None
+            return User.__pydantic_model__.from_orm(user_model)
+
+    @staticmethod
+    async def get_user_by_id_async(
+        id: int, read_only: bool = True
+    ) -> User.__pydantic_model__ or None:
+        """Pass `read_only=False` to read the user from the primary, for
+        checks a lagging replica must not answer."""
+        async with AsyncDatabaseSession().withSession(
+                read_only=read_only, user_id=id) as session:
+            user_model = await session.get(User, id)
+            if user_model is None:
+                return None
+            return User.__pydantic_model__.from_orm(user_model)
+
     @staticmethod
     def authenticate_user(email: str, password: str):
         user = AuthService.get_user_by_email(email)
@@ -68,12 +90,45 @@ class AuthService:
             return False
         return user
 
+    @staticmethod
+    async def authenticate_user_async(email: str, password: str):
+        """Async variant of `authenticate_user`.
+
+        A password hashed with another cost than BCRYPT_SALT is rehashed
+        with the configured cost once it has been verified.
+        """
+        user = await AuthService.get_user_by_email_async(email)
+        if not user:
+            return False
+
+        if not await password_hasher.verify_async(password, user.password):
+            return False
+
+        if password_hasher.needs_rehash(user.password):
+            try:
+                hashed_password = await password_hasher.hash_async(password)
+            except CustomError:
+                # Saturated, the next login upgrades the hash
+                return user
+            async with AsyncDatabaseSession().withSession() as session:
+                await session.execute(
+                    update(User).where(User.id == user.id)
+                    .values(password=hashed_password))
+            user_cache.invalidate(user.id)
+        return user
+
     @staticmethod
     def create_access_token(user):
         data = {
             "id": user.id,
             "email": user.email,
-            "type": "access"
+            "type": "access",
+            # Authorization claims, read instead of the user with
+            # STATELESS_AUTH
+            "active": user.active,
+            "verified": user.is_email_verified,
+            "admin": user.is_admin,
+            "ver": user.token_version
         }
         to_encode = data.copy()
         expire = datetime.now(
@@ -90,7 +145,8 @@ class AuthService:
         data = {
             "id": user.id,
             "email": user.email,
-            "type": "refresh"
+            "type": "refresh",
+            "ver": user.token_version
         }
         to_encode = data.copy()
         expire = datetime.now(
@@ -112,6 +168,28 @@ class AuthService:
             "refresh": refresh_token
         }
 
+    @staticmethod
+    def user_from_claims(payload: dict) -> UserClaimsSchema or None:
+        """The user signed into an access token, None for tokens issued
+        without authorization claims."""
+        if "ver" not in payload:
+            return None
+        return UserClaimsSchema(
+            id=payload["id"],
+            email=payload["email"],
+            active=payload["active"],
+            is_email_verified=payload["verified"],
+            is_admin=payload["admin"],
+            token_version=payload["ver"]
+        )
+
+    @staticmethod
+    def revoke_tokens(user_orm: User):
+        """Invalidates every token issued to the user at its next
+        refresh; access tokens already issued stay valid until they
+        expire."""
+        user_orm.token_version = (user_orm.token_version or 0) + 1
+
     @staticmethod
     def verify_jwt_token(token: str, token_type: str):
         try:
@@ -1,2 +1,241 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import insert
+
+from src.config import Config
+from src.models.chat import Chat, Prompt, Sentiment
+from src.schemas.chat import ChatSchema, PromptSchema, SentimentSchema
+from src.services.inference import model_registry
+from src.services.sentiment import pack_scores, unpack_scores
+from src.services.sentiment_rollup import SentimentRollupService
+
+
+# Tokens the chat template adds around a turn ([INST], [/INST], </s>)
+TURN_OVERHEAD_TOKENS = 8
+# Only the top sentiments scoring above the minimum get a Sentiment row
+SENTIMENT_TOP_K = 3
+SENTIMENT_MIN_SCORE = 0.3
+
+
 class ChatService:
-    pass
+    """Chat queries shared by the views and the query plan check."""
+
+    @staticmethod
+    def chats_query(session, user_id: int):
+        return session.query(Chat).where(Chat.owner_id == user_id)
+
+    @staticmethod
+    def prompts_query(session, chat_id: int):
+        return session.query(Prompt).where(Prompt.chat_id == chat_id)
+
+    @staticmethod
+    def history_query(session, chat_id: int):
+        return session.query(
+            Prompt.prompt,
+            Prompt.bot_response,
+            Prompt.prompt_token_count,
+            Prompt.response_token_count
+        ).where(
+            Prompt.chat_id == chat_id
+        ).order_by(
+            Prompt.created_at.desc(), Prompt.id.desc()
+        ).limit(Config.CHAT_CONTEXT_MAX_TURNS)
+
+    @staticmethod
+    def sentiments_query(session, user_id: int, start_date: datetime,
+                         end_date: datetime):
+        # Sentiment.Prompt.Chat.owner_id == user.id
+        return session.query(Sentiment)\
+            .join(Sentiment.prompt)\
+            .join(Prompt.chat)\
+            .where(Chat.owner_id == user_id)\
+            .where(Sentiment.created_at >= start_date)\
+            .where(Sentiment.created_at <= end_date)
+
+    @staticmethod
+    def emotion_history_query(session, user_id: int, start_date: datetime,
+                              end_date: datetime):
+        return session.query(Prompt.created_at, Prompt.emotion_scores)\
+            .join(Prompt.chat)\
+            .where(Chat.owner_id == user_id)\
+            .where(Prompt.emotion_scores.is_not(None))\
+            .where(Prompt.created_at >= start_date)\
+            .where(Prompt.created_at <= end_date)\
+            .order_by(Prompt.created_at, Prompt.id)
+
+    @staticmethod
+    def emotion_matrix(session, user_id: int, start_date: datetime,
+                       end_date: datetime) -> Tuple[np.ndarray, np.ndarray]:
+        """Loads a user's emotion history in one query.
+
+        Prompts saved before emotion vectors were stored are skipped.
+
+        Returns:
+            A tuple, (timestamps, scores): datetime64 timestamps in
+            ascending order and an (n, len(GO_EMOTIONS_LABELS)) float32
+            score matrix
+        """
+        rows = ChatService.emotion_history_query(
+            session, user_id, start_date, end_date).all()
+        timestamps = np.array(
+            [row.created_at for row in rows], dtype="datetime64[us]")
+        return (timestamps, unpack_scores(
+            [row.emotion_scores for row in rows]))
+
+    @staticmethod
+    def exact_token_count(text: str) -> Optional[int]:
+        """Counts tokens with the generator's tokenizer, None when the
+        generator, and with it the tokenizer, is not available.
+
+        Only exact counts are stored on Prompt rows.
+        """
+        tokenizer = model_registry.tokenizer
+        if tokenizer is None:
+            return None
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    @staticmethod
+    def count_tokens(text: str) -> int:
+        """Like `exact_token_count`, falling back to an estimate of 4
+        characters per token."""
+        token_count = ChatService.exact_token_count(text)
+        return len(text) // 4 + 1 if token_count is None else token_count
+
+    @staticmethod
+    def build_messages(
+        session,
+        chat_id: int,
+        prompt: str,
+        token_budget: int = Config.CHAT_CONTEXT_TOKENS
+    ) -> Tuple[List[Dict[str, str]], int]:
+        """Builds the conversation for a new prompt from earlier turns.
+
+        Turns are added newest first until the token budget, minus the
+        room reserved for the response, is spent; older turns are dropped.
+        Token counts stored on each Prompt row are used, so only the new
+        prompt is tokenized.
+
+        Returns:
+            A tuple, (messages, prompt_token_count); the count is None
+            when the tokenizer is not loaded, so no estimate is stored
+        """
+        prompt_token_count = ChatService.exact_token_count(prompt)
+        budget = token_budget - Config.GENERATION_MAX_NEW_TOKENS \
+            - TURN_OVERHEAD_TOKENS - (
+                ChatService.count_tokens(prompt)
+                if prompt_token_count is None else prompt_token_count)
+
+        # A chat that is not persisted yet has no history
+        turns = ChatService.history_query(session, chat_id) \
+            if chat_id is not None else []
+
+        history = []
+        for turn in turns:
+            # Rows saved without an exact token count are counted here
+            cost = TURN_OVERHEAD_TOKENS + (
+                turn.prompt_token_count
+                if turn.prompt_token_count is not None
+                else ChatService.count_tokens(turn.prompt)
+            ) + (
+                turn.response_token_count
+                if turn.response_token_count is not None
+                else ChatService.count_tokens(turn.bot_response)
+            )
+            if cost > budget:
+                break
+            budget -= cost
+            history.append(turn)
+
+        messages = []
+        for turn in reversed(history):
+            messages.append({"role": "user", "content": turn.prompt})
+            messages.append({
+                "role": "assistant", "content": turn.bot_response
+            })
+        messages.append({
+            "role": "user",
+            "content": prompt
+        })
+        return (messages, prompt_token_count)
+
+    @staticmethod
+    def sentiment_rows(prompt_id: int, generated_sentiments,
+                       created_at: datetime) -> List[dict]:
+        """Sentiment rows for the top scores of a classifier result."""
+        return [
+            {
+                "prompt_id": prompt_id,
+                "score": sentiment['score'],
+                "sentiment": sentiment['label'],
+                "created_at": created_at,
+                "updated_at": created_at
+            }
+            for sentiment in generated_sentiments[:SENTIMENT_TOP_K]
+            if sentiment['score'] > SENTIMENT_MIN_SCORE
+        ]
+
+    @staticmethod
+    def save_turn(
+        session,
+        chat_orm: Chat,
+        prompt: str,
+        prompt_token_count: Optional[int],
+        generated_response: str,
+        generated_sentiments
+    ) -> dict:
+        """Persists a chat turn as one unit of work.
+
+        `generated_sentiments` is the classifier's full distribution,
+        highest score first: it is packed onto the prompt, and its top
+        scores are stored as Sentiment rows.
+
+        The chat (when new) and prompt are flushed for their ids, the
+        sentiments are inserted in a single executemany with RETURNING
+        where the database supports it and added to the daily rollups, and
+        everything is committed once.
+        The response data is built before the commit so nothing is
+        reloaded afterwards.
+        """
+        if chat_orm.id is None:
+            session.add(chat_orm)
+            session.flush()
+
+        prompt_orm = Prompt(
+            chat_id=chat_orm.id,
+            bot_response=generated_response,
+            prompt=prompt,
+            prompt_token_count=prompt_token_count,
+            response_token_count=ChatService.exact_token_count(
+                generated_response),
+            emotion_scores=pack_scores(generated_sentiments)
+        )
+        session.add(prompt_orm)
+        session.flush()
+
+        sentiment_rows = ChatService.sentiment_rows(
+            prompt_orm.id, generated_sentiments, datetime.utcnow())
+        sentiments_orm = []
+        if sentiment_rows:
+            if session.get_bind().dialect.insert_executemany_returning:
+                sentiments_orm = session.scalars(
+                    insert(Sentiment).returning(Sentiment), sentiment_rows
+                ).all()
+            else:
+                sentiments_orm = [Sentiment(**row) for row in sentiment_rows]
+                session.add_all(sentiments_orm)
+                session.flush()
+            SentimentRollupService.record(
+                session, chat_orm.owner_id, sentiment_rows)
+
+        data = {
+            "chat": ChatSchema.from_orm(chat_orm).model_dump(),
+            "prompt": PromptSchema.from_orm(prompt_orm).model_dump(),
+            "sentiments": [
+                SentimentSchema.from_orm(sentiment_orm).model_dump()
+                for sentiment_orm in sentiments_orm
+            ]
+        }
+        session.commit()
+        return data
@@ -0,0 +1,164 @@
+import json
+import os
+from datetime import datetime
+from typing import Iterator, List
+
+from sqlalchemy import select
+
+from src.models import DatabaseSession
+from src.models.chat import Chat, Prompt, Sentiment
+from src.services.sentiment import GO_EMOTIONS_LABELS, unpack_scores
+
+
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_TABLES = ("chats", "prompts", "sentiments")
+
+
+def _export_select(table: str, user_id: int = None):
+    if table == "chats":
+        query = select(
+            Chat.id, Chat.owner_id, Chat.title, Chat.semantic_cache_enabled,
+            Chat.created_at, Chat.updated_at
+        )
+        if user_id is not None:
+            query = query.where(Chat.owner_id == user_id)
+        return query.order_by(Chat.id)
+
+    if table == "prompts":
+        query = select(
+            Prompt.id, Prompt.chat_id, Prompt.prompt, Prompt.bot_response,
+            Prompt.prompt_token_count, Prompt.response_token_count,
+            Prompt.emotion_scores, Prompt.created_at, Prompt.updated_at
+        )
+        if user_id is not None:
+            query = query.join(Prompt.chat).where(Chat.owner_id == user_id)
+        return query.order_by(Prompt.id)
+
+    query = select(
+        Sentiment.id, Sentiment.prompt_id, Sentiment.sentiment,
+        Sentiment.score, Sentiment.created_at, Sentiment.updated_at
+    )
+    if user_id is not None:
+        query = query.join(Sentiment.prompt).join(Prompt.chat)\
+            .where(Chat.owner_id == user_id)
+    return query.order_by(Sentiment.id)
+
+
+def _decode_emotions(rows: List[dict]) -> List[dict]:
+    """Replaces packed emotion vectors with lists in label order."""
+    packed = [row for row in rows if row["emotion_scores"] is not None]
+    if packed:
+        vectors = unpack_scores([row["emotion_scores"] for row in packed])
+        for (row, vector) in zip(packed, vectors.tolist()):
+            row["emotion_scores"] = vector
+    return rows
+
+
+class ExportService:
+    """Streams chats, prompts and sentiments out of the database.
+
+    Rows are read from a read replica, when one is configured, through a
+    server-side cursor in partitions of `batch_size`, so memory use does
+    not grow with the table size. Each table is read in id order; a user
+    export only includes rows of that user's chats.
+    """
+
+    @staticmethod
+    def iter_partitions(session, table: str, user_id: int = None,
+                        batch_size: int = EXPORT_BATCH_SIZE
+                        ) -> Iterator[List[dict]]:
+        result = session.execute(
+            _export_select(table, user_id).execution_options(
+                stream_results=True, yield_per=batch_size)
+        )
+        for partition in result.mappings().partitions():
+            rows = [dict(row) for row in partition]
+            yield _decode_emotions(rows) if table == "prompts" else rows
+
+    @staticmethod
+    def ndjson(user_id: int = None,
+               batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+        """NDJSON export, one chunk per partition.
+
+        The first line describes the export; every following line is a
+        row with its table in `type`.
+        """
+        yield (json.dumps({
+            "type": "export",
+            "exported_at": datetime.utcnow().isoformat(),
+            "user_id": user_id,
+            "emotion_labels": GO_EMOTIONS_LABELS,
+        }) + "\n").encode("utf-8")
+
+        with DatabaseSession().withSession(read_only=True) as session:
+            for table in EXPORT_TABLES:
+                for rows in ExportService.iter_partitions(
+                        session, table, user_id, batch_size):
+                    yield "".join(
+                        json.dumps({"type": table[:-1], **row}, default=str)
+                        + "\n"
+                        for row in rows
+                    ).encode("utf-8")
+
+    @staticmethod
+    def write_parquet(directory: str, user_id: int = None,
+                      batch_size: int = EXPORT_BATCH_SIZE) -> dict:
+        """Writes one Parquet file per table into `directory`.
+
+        Every partition becomes a row group, so only one partition is
+        held in memory at a time.
+
+        Returns:
+            Rows written per table
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Stored timestamps are UTC
+        timestamp = pa.timestamp("us", tz="UTC")
+        schemas = {
+            "chats": pa.schema([
+                ("id", pa.int64()),
+                ("owner_id", pa.int64()),
+                ("title", pa.string()),
+                ("semantic_cache_enabled", pa.bool_()),
+                ("created_at", timestamp),
+                ("updated_at", timestamp),
+            ]),
+            "prompts": pa.schema([
+                ("id", pa.int64()),
+                ("chat_id", pa.int64()),
+                ("prompt", pa.string()),
+                ("bot_response", pa.string()),
+                ("prompt_token_count", pa.int32()),
+                ("response_token_count", pa.int32()),
+                ("emotion_scores",
+                 pa.list_(pa.float32(), len(GO_EMOTIONS_LABELS))),
+                ("created_at", timestamp),
+                ("updated_at", timestamp),
+            ], metadata={"emotion_labels": ",".join(GO_EMOTIONS_LABELS)}),
+            "sentiments": pa.schema([
+                ("id", pa.int64()),
+                ("prompt_id", pa.int64()),
+                ("sentiment", pa.string()),
+                ("score", pa.float64()),
+                ("created_at", timestamp),
+                ("updated_at", timestamp),
+            ]),
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        written = {}
+        with DatabaseSession().withSession(read_only=True) as session:
+            for table in EXPORT_TABLES:
+                written[table] = 0
+                path = os.path.join(directory, f"{table}.parquet")
+                with pq.ParquetWriter(path, schemas[table]) as writer:
+                    for rows in ExportService.iter_partitions(
+                            session, table, user_id, batch_size):
+                        writer.write_table(pa.Table.from_pylist(
+                            rows, schema=schemas[table]))
+                        written[table] += len(rows)
+        return written
@@ -0,0 +1,332 @@
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from src.config import Config
+from src.services.inference import model_registry
+from src.services.prefix_cache import PrefixCache, prefix_cache
+from src.utils.batching import MicroBatcher
+from src.utils.metrics import metrics
+
+
+Messages = List[Dict[str, str]]
+SENTENCE_TERMINATORS = (".", "!", "?")
+
+
+def trim_to_sentence(text: str) -> str:
+    """Cuts a response at its last sentence end, if there is one."""
+    last_full_stop_index = max(
+        text.rfind(terminator) for terminator in SENTENCE_TERMINATORS)
+    if last_full_stop_index != -1:
+        text = text[:last_full_stop_index + 1]
+    return text
+
+
+_sentence_end_ids = {}
+
+
+def sentence_end_token_ids(tokenizer):
+    """Ids of the vocabulary tokens that finish a sentence."""
+    key = id(tokenizer)
+    if key not in _sentence_end_ids:
+        import torch
+
+        ids = [
+            token_id for token_id in range(len(tokenizer))
+            if tokenizer.decode([token_id]).rstrip().endswith(
+                SENTENCE_TERMINATORS)
+        ]
+        _sentence_end_ids[key] = torch.tensor(ids, dtype=torch.long)
+    return _sentence_end_ids[key]
+
+
+class SentenceBoundaryCriteria:
+    """Stops each sequence at the first sentence end after min_new_tokens.
+
+    Returns a per-sequence flag so finished rows of a batch are padded
+    while the others keep generating.
+    """
+
+    def __init__(self, tokenizer, prompt_length: int, min_new_tokens: int):
+        self.prompt_length = prompt_length
+        self.min_new_tokens = min_new_tokens
+        self.end_ids = sentence_end_token_ids(tokenizer)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        if input_ids.shape[-1] - self.prompt_length < self.min_new_tokens:
+            return torch.zeros(
+                input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        return torch.isin(
+            input_ids[:, -1], self.end_ids.to(input_ids.device))
+
+
+class CancelCriteria:
+    """Stops every sequence once `cancelled` is set, e.g. when the client
+    of a stream has gone away."""
+
+    def __init__(self, cancelled: threading.Event):
+        self.cancelled = cancelled
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        return torch.full(
+            (input_ids.shape[0],), self.cancelled.is_set(),
+            dtype=torch.bool, device=input_ids.device)
+
+
+class GenerationScheduler:
+    """Batches concurrent chat generations into single `generate` calls.
+
+    Prompts are rendered with the chat template, left padded and generated
+    together; every caller gets back only its own decoded continuation.
+    The tokenizer and model default to the ones in the model registry,
+    a small causal LM can be passed instead to exercise it on CPU.
+    """
+
+    def __init__(
+        self,
+        tokenizer=None,
+        generator=None,
+        device: str = None,
+        max_batch_size: int = Config.GENERATION_MAX_BATCH_SIZE,
+        max_wait_ms: float = Config.GENERATION_MAX_WAIT_MS,
+        max_new_tokens: int = Config.GENERATION_MAX_NEW_TOKENS,
+        min_new_tokens: int = 20,
+        stop_at_sentence: bool = Config.GENERATION_STOP_AT_SENTENCE,
+        sentence_min_new_tokens: int = Config.GENERATION_SENTENCE_MIN_TOKENS,
+        prefix_cache: Optional[PrefixCache] = (
+            prefix_cache if Config.PREFIX_CACHE_ENABLED else None),
+        name: str = "generation"
+    ):
+        self._tokenizer = tokenizer
+        self._generator = generator
+        self._device = device
+        self.max_new_tokens = max_new_tokens
+        self.min_new_tokens = min_new_tokens
+        self.stop_at_sentence = stop_at_sentence
+        self.sentence_min_new_tokens = sentence_min_new_tokens
+        self.prefix_cache = prefix_cache
+        self.name = name
+        # Batches and streams share the model, one generate call at a time
+        self._generate_lock = threading.Lock()
+        self.batcher = MicroBatcher(
+            self.generate_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name=name
+        )
+
+    @property
+    def tokenizer(self):
+        return self._tokenizer or model_registry.tokenizer
+
+    @property
+    def generator(self):
+        return self._generator or model_registry.generator
+
+    @property
+    def device(self):
+        return self._device or model_registry.device
+
+    def generate(self, messages: Messages, chat_id: int = None,
+                 timeout: float = None) -> str:
+        """Queues a conversation and blocks until its response is ready.
+
+        When chat_id is given and the prompt ends up alone in its batch,
+        the chat's cached prefix keys/values are reused.
+        """
+        return self.batcher.run((messages, chat_id), timeout=timeout)
+
+    def _tokenize(self, conversations: List[Messages]):
+        tokenizer = self.tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        prompts = [
+            tokenizer.apply_chat_template(
+                conversation=messages,
+                tokenize=False,
+                add_generation_prompt=True
+            )
+            for messages in conversations
+        ]
+        # The chat template already renders the bos token
+        return tokenizer(
+            prompts,
+            padding=True,
+            add_special_tokens=False,
+            return_tensors='pt'
+        ).to(self.device)
+
+    def generate_batch(
+        self, requests: List[Tuple[Messages, Optional[int]]]
+    ) -> List[str]:
+        import torch
+
+        if len(requests) == 1 and requests[0][1] is not None \
+                and self.prefix_cache is not None:
+            (messages, chat_id) = requests[0]
+            return [self._generate_with_prefix_cache(messages, chat_id)]
+
+        inputs = self._tokenize([messages for (messages, _) in requests])
+        prompt_length = inputs["input_ids"].shape[-1]
+
+        started = time.perf_counter()
+        with self._generate_lock, torch.no_grad():
+            output_ids = self.generator.generate(
+                **inputs,
+                **self._generation_kwargs(prompt_length),
+            )
+        elapsed = time.perf_counter() - started
+
+        # Left padding aligns every prompt to end at prompt_length
+        return self._decode(output_ids[:, prompt_length:], elapsed)
+
+    def _generate_with_prefix_cache(self, messages: Messages,
+                                    chat_id: int) -> str:
+        import torch
+
+        inputs = self._tokenize([messages])
+        token_ids = inputs["input_ids"][0]
+        prompt_length = len(token_ids)
+        past_key_values = self._lookup_prefix(chat_id, token_ids)
+
+        started = time.perf_counter()
+        with self._generate_lock, torch.no_grad():
+            output = self.generator.generate(
+                **inputs,
+                past_key_values=past_key_values,
+                **self._generation_kwargs(prompt_length),
+                return_dict_in_generate=True,
+            )
+        elapsed = time.perf_counter() - started
+
+        sequence = output.sequences[0]
+        self.prefix_cache.store(chat_id, sequence, output.past_key_values)
+        return self._decode(sequence[None, prompt_length:], elapsed)[0]
+
+    def _lookup_prefix(self, chat_id, token_ids):
+        (past_key_values, reused) = self.prefix_cache.lookup(
+            chat_id, token_ids)
+        metrics.observe(f"{self.name}.prefill_tokens",
+                        len(token_ids) - reused)
+        return past_key_values
+
+    def _generation_kwargs(self, prompt_length: int,
+                           cancelled: threading.Event = None) -> dict:
+        from transformers import StoppingCriteriaList
+
+        kwargs = {
+            "max_new_tokens": self.max_new_tokens,
+            "min_new_tokens": self.min_new_tokens,
+            "do_sample": True,
+            "pad_token_id": self.tokenizer.pad_token_id,
+        }
+        stopping_criteria = StoppingCriteriaList()
+        if self.stop_at_sentence:
+            stopping_criteria.append(SentenceBoundaryCriteria(
+                self.tokenizer,
+                prompt_length=prompt_length,
+                min_new_tokens=self.sentence_min_new_tokens
+            ))
+        if cancelled is not None:
+            stopping_criteria.append(CancelCriteria(cancelled))
+        if stopping_criteria:
+            kwargs["stopping_criteria"] = stopping_criteria
+        return kwargs
+
+    def _decode(self, new_tokens, elapsed: float) -> List[str]:
+        tokenizer = self.tokenizer
+        new_tokens = new_tokens.detach().cpu()
+        generated = int((new_tokens != tokenizer.pad_token_id).sum())
+        metrics.increment(f"{self.name}.tokens", generated)
+        if elapsed > 0:
+            metrics.observe(f"{self.name}.tokens_per_second",
+                            generated / elapsed)
+
+        responses = tokenizer.batch_decode(
+            new_tokens,
+            skip_special_tokens=True
+        )
+        return [trim_to_sentence(response.strip()) for response in responses]
+
+    def stream(self, messages: Messages,
+               chat_id: int = None) -> Iterator[str]:
+        """Generates a single conversation, yielding text as it is decoded.
+
+        Streams bypass batching so the first tokens reach the caller as
+        soon as they are produced. When chat_id is given the chat's cached
+        prefix keys/values are reused and updated, as in `generate`.
+        Closing the iterator early stops the generation at its next token
+        and releases the model.
+        """
+        import torch
+        from transformers import TextIteratorStreamer
+
+        tokenizer = self.tokenizer
+        inputs = self._tokenize([messages])
+        prompt_length = inputs["input_ids"].shape[-1]
+        use_prefix_cache = chat_id is not None \
+            and self.prefix_cache is not None
+        past_key_values = self._lookup_prefix(
+            chat_id, inputs["input_ids"][0]) if use_prefix_cache else None
+        streamer = TextIteratorStreamer(
+            tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True
+        )
+        errors = []
+        cancelled = threading.Event()
+
+        def run():
+            try:
+                with self._generate_lock, torch.no_grad():
+                    output = self.generator.generate(
+                        **inputs,
+                        streamer=streamer,
+                        past_key_values=past_key_values,
+                        **self._generation_kwargs(prompt_length, cancelled),
+                        return_dict_in_generate=True,
+                    )
+                if use_prefix_cache:
+                    self.prefix_cache.store(
+                        chat_id, output.sequences[0], output.past_key_values)
+            except Exception as E:
+                errors.append(E)
+                # Unblock the consumer
+                streamer.end()
+
+        started = time.perf_counter()
+        thread = threading.Thread(
+            target=run, name=f"{self.name}-stream", daemon=True)
+        thread.start()
+
+        first_token = True
+        try:
+            for text in streamer:
+                if not text:
+                    continue
+                if first_token:
+                    first_token = False
+                    metrics.observe(
+                        f"{self.name}.stream_time_to_first_token_ms",
+                        (time.perf_counter() - started) * 1000
+                    )
+                yield text
+        except GeneratorExit:
+            # The consumer stopped reading, don't generate for nobody; the
+            # thread finishes on its own after the current step
+            cancelled.set()
+            metrics.increment(f"{self.name}.streams_cancelled")
+            raise
+        thread.join()
+
+        if errors:
+            metrics.increment(f"{self.name}.errors")
+            raise errors[0]
+
+
+generation_scheduler = GenerationScheduler()
@@ -0,0 +1,311 @@
+import threading
+import time
+from enum import Enum
+
+from src.config import Config
+from src.utils.logger import logger
+
+
+class ModelState(Enum):
+    unloaded = "unloaded"
+    loading = "loading"
+    ready = "ready"
+    failed = "failed"
+
+
+class SentimentBackend(Enum):
+    torch = "torch"
+    int8 = "int8"
+    onnx = "onnx"
+
+
+def build_text_classifier(backend: str = None):
+    """Builds the go_emotions pipeline on the requested backend.
+
+    torch: full precision PyTorch model.
+    int8: PyTorch model with Linear layers dynamically quantized to int8.
+    onnx: ONNX Runtime session, exported once to SENTIMENT_ONNX_DIR.
+    Every backend is wrapped in a transformers pipeline, so callers get
+    the same label/score output whichever one is selected.
+    """
+    backend = SentimentBackend(backend or Config.SENTIMENT_BACKEND)
+    from transformers import pipeline, AutoTokenizer
+
+    if backend == SentimentBackend.torch:
+        return pipeline(
+            task="text-classification",
+            model=Config.SENTIMENT_MODEL, top_k=None
+        )
+
+    tokenizer = AutoTokenizer.from_pretrained(Config.SENTIMENT_MODEL)
+    if backend == SentimentBackend.int8:
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        model = AutoModelForSequenceClassification.from_pretrained(
+            Config.SENTIMENT_MODEL)
+        model.eval()
+        model = torch.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        import os
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+
+        if os.path.isdir(Config.SENTIMENT_ONNX_DIR):
+            model = ORTModelForSequenceClassification.from_pretrained(
+                Config.SENTIMENT_ONNX_DIR)
+        else:
+            model = ORTModelForSequenceClassification.from_pretrained(
+                Config.SENTIMENT_MODEL, export=True)
+            model.save_pretrained(Config.SENTIMENT_ONNX_DIR)
+
+    return pipeline(
+        task="text-classification",
+        model=model, tokenizer=tokenizer, top_k=None
+    )
+
+
+class ModelRegistry:
+    """Owns the sentiment classifier and chat generator.
+
+    Nothing is loaded at import time, models are loaded on first access
+    or explicitly through `load_all` (e.g. from the FastAPI startup hook).
+    torch, transformers and peft are only imported once a model is loaded.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._text_classifier = None
+        self._tokenizer = None
+        self._generator = None
+        self._embedder = None
+        self.device = "cpu"
+        self.generator_model = None
+        self.states = {
+            "text_classifier": ModelState.unloaded,
+            "generator": ModelState.unloaded,
+            "embedder": ModelState.unloaded
+        }
+        self.errors = {}
+        self.load_seconds = {}
+
+    @property
+    def text_classifier(self):
+        self.load_text_classifier()
+        return self._text_classifier
+
+    @property
+    def tokenizer(self):
+        self.load_generator()
+        return self._tokenizer
+
+    @property
+    def generator(self):
+        """Returns the generator, or None if it could not be loaded."""
+        self.load_generator()
+        return self._generator
+
+    @property
+    def embedder(self):
+        """Sentence embedding model used by the semantic response cache."""
+        self.load_embedder()
+        return self._embedder
+
+    def load_text_classifier(self, warmup=True):
+        if self.states["text_classifier"] == ModelState.ready:
+            return
+        # A failed classifier is retried, chat can not work without it
+        with self._lock:
+            if self.states["text_classifier"] == ModelState.ready:
+                return
+            self.states["text_classifier"] = ModelState.loading
+            started = time.perf_counter()
+            try:
+                text_classifier = build_text_classifier()
+                if warmup:
+                    text_classifier(["Warming up the sentiment model."])
+                self._text_classifier = text_classifier
+                self.states["text_classifier"] = ModelState.ready
+            except Exception as E:
+                logger.error(f"::> Failed to load sentiment model: {E}")
+                self.errors["text_classifier"] = str(E)
+                self.states["text_classifier"] = ModelState.failed
+                raise
+            finally:
+                self.load_seconds["text_classifier"] = round(
+                    time.perf_counter() - started, 3)
+
+    def load_generator(self, warmup=True):
+        if self.states["generator"] in (ModelState.ready, ModelState.failed):
+            return
+        with self._lock:
+            if self.states["generator"] != ModelState.unloaded:
+                return
+            self.states["generator"] = ModelState.loading
+            started = time.perf_counter()
+            try:
+                import torch
+                from transformers import AutoTokenizer
+
+                self.device = "cuda" if torch.cuda.is_available() else "cpu"
+                if self.device == "cuda":
+                    model_id = Config.GENERATOR_BASE_MODEL
+                elif Config.GENERATOR_CPU_ENABLED:
+                    model_id = Config.GENERATOR_CPU_MODEL
+                else:
+                    raise RuntimeError(
+                        "No CUDA GPU available and GENERATOR_CPU_ENABLED "
+                        "is not set")
+
+                # Load tokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(
+                    model_id,
+                    add_bos_token=True,
+                    trust_remote_code=True,
+                    padding_side='left'
+                )
+                self.generator_model = model_id
+
+                if self.device == "cuda":
+                    generator = self._load_gpu_generator()
+                else:
+                    generator = self._load_cpu_generator()
+
+                if warmup:
+                    self._warmup_generator(generator)
+                self._generator = generator
+                self.states["generator"] = ModelState.ready
+            except Exception as E:
+                # The chat view falls back to a canned reply without a model
+                logger.error(f"::> Failed to load chat model: {E}")
+                self.errors["generator"] = str(E)
+                self.states["generator"] = ModelState.failed
+            finally:
+                self.load_seconds["generator"] = round(
+                    time.perf_counter() - started, 3)
+
+    def load_embedder(self, warmup=True):
+        if self.states["embedder"] == ModelState.ready:
+            return
+        with self._lock:
+            if self.states["embedder"] == ModelState.ready:
+                return
+            self.states["embedder"] = ModelState.loading
+            started = time.perf_counter()
+            try:
+                from sentence_transformers import SentenceTransformer
+
+                embedder = SentenceTransformer(
+                    Config.SEMANTIC_CACHE_MODEL, device="cpu")
+                if warmup:
+                    embedder.encode(["Warming up the embedding model."])
+                self._embedder = embedder
+                self.states["embedder"] = ModelState.ready
+            except Exception as E:
+                logger.error(f"::> Failed to load embedding model: {E}")
+                self.errors["embedder"] = str(E)
+                self.states["embedder"] = ModelState.failed
+                raise
+            finally:
+                self.load_seconds["embedder"] = round(
+                    time.perf_counter() - started, 3)
+
+    def _load_gpu_generator(self):
+        from transformers import AutoModelForCausalLM
+        from peft import PeftModel
+
+        # Create peft model using base_model and finetuned adapter
+        model = AutoModelForCausalLM.from_pretrained(
+            Config.GENERATOR_BASE_MODEL,
+            load_in_4bit=True,
+            device_map='auto',
+            torch_dtype='auto'
+        )
+        generator = PeftModel.from_pretrained(model, Config.GENERATOR_ADAPTER)
+        generator.to(self.device)
+        generator.eval()
+        return generator
+
+    def _load_cpu_generator(self):
+        """Loads GENERATOR_CPU_MODEL for CPU-only nodes.
+
+        The LoRA adapter, when configured, is merged into the base weights
+        so PEFT adds no per-token overhead, then Linear layers are
+        optionally quantized to int8.
+        """
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        if Config.GENERATOR_CPU_THREADS:
+            torch.set_num_threads(Config.GENERATOR_CPU_THREADS)
+
+        model = AutoModelForCausalLM.from_pretrained(
+            Config.GENERATOR_CPU_MODEL,
+            torch_dtype=torch.float32,
+            low_cpu_mem_usage=True
+        )
+        if Config.GENERATOR_CPU_ADAPTER:
+            from peft import PeftModel
+
+            model = PeftModel.from_pretrained(
+                model, Config.GENERATOR_CPU_ADAPTER).merge_and_unload()
+        model.eval()
+
+        if Config.GENERATOR_CPU_QUANTIZATION == "int8":
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _warmup_generator(self, generator):
+        input_ids = self._tokenizer.apply_chat_template(
+            conversation=[{"role": "user", "content": "Hello"}],
+            tokenize=True,
+            add_generation_prompt=True,
+            return_tensors='pt').to(self.device)
+        generator.generate(
+            input_ids=input_ids,
+            max_new_tokens=1,
+            pad_token_id=2,
+        )
+
+    def load_all(self):
+        try:
+            self.load_text_classifier()
+        except Exception:
+            pass
+        self.load_generator()
+        if Config.SEMANTIC_CACHE_ENABLED:
+            try:
+                self.load_embedder()
+            except Exception:
+                pass
+
+    def load_in_background(self) -> threading.Thread:
+        thread = threading.Thread(
+            target=self.load_all, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self) -> bool:
+        """The classifier must be usable; the generator may have failed,
+        in which case chat degrades to the canned reply."""
+        return (
+            self.states["text_classifier"] == ModelState.ready and
+            self.states["generator"] in (ModelState.ready, ModelState.failed)
+        )
+
+    def status(self) -> dict:
+        return {
+            "ready": self.is_ready(),
+            "device": self.device,
+            "generator_model": self.generator_model,
+            "sentiment_backend": Config.SENTIMENT_BACKEND,
+            "models": {
+                name: state.value for name, state in self.states.items()
+            },
+            "load_seconds": self.load_seconds,
+            "errors": self.errors
+        }
+
+
+model_registry = ModelRegistry()
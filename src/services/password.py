@@ -0,0 +1,164 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+import bcrypt
+from fastapi import status
+
+from src.config import Config
+from src.utils import CustomError
+from src.utils.metrics import metrics
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(
+        password=password.encode("utf-8"),
+        salt=bcrypt.gensalt(rounds)
+    ).decode("utf-8")
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    try:
+        return bcrypt.checkpw(
+            plain_password.encode("utf-8"),
+            hashed_password.encode("utf-8")
+        )
+    except Exception:
+        return False
+
+
+def hash_cost(hashed_password: str) -> int:
+    """The cost factor of a bcrypt hash, "$2b$<cost>$<salt+hash>"."""
+    try:
+        return int(hashed_password.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Runs bcrypt in a bounded process pool.
+
+    bcrypt is deliberately slow; in a process pool it neither holds the
+    GIL nor the request threadpool of the worker. At most `max_pending`
+    hashes are queued or running, further requests are rejected with a
+    429 rather than queueing behind them. A pool broken by a crashed
+    worker is replaced and the call retried once, then a 503 is raised.
+    """
+
+    def __init__(
+        self,
+        workers: int = Config.BCRYPT_WORKERS,
+        max_pending: int = Config.BCRYPT_MAX_PENDING,
+        rounds: int = Config.BCRYPT_SALT,
+        name: str = "bcrypt"
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.name = name
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=get_context("spawn")
+                )
+            return self._pool
+
+    def _reset_pool(self, pool: ProcessPoolExecutor):
+        """Drops a pool broken by a crashed worker, the next call starts
+        a new one."""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False)
+        metrics.increment(f"{self.name}.pool_restarts")
+
+    def _submit(self, pool: ProcessPoolExecutor, function, *args):
+        if not self._pending.acquire(blocking=False):
+            metrics.increment(f"{self.name}.rejected")
+            raise CustomError(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many authentication requests, try again",
+                headers={"Retry-After": "1"}
+            )
+
+        submitted_at = time.perf_counter()
+
+        def done(_):
+            self._pending.release()
+            metrics.observe(
+                f"{self.name}.ms", (time.perf_counter() - submitted_at) * 1000)
+
+        try:
+            future = pool.submit(function, *args)
+        except Exception:
+            self._pending.release()
+            raise
+        future.add_done_callback(done)
+        return future
+
+    def _unavailable(self) -> CustomError:
+        return CustomError(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is unavailable, try again",
+            headers={"Retry-After": "1"}
+        )
+
+    def _run(self, function, *args):
+        # A broken pool is replaced and the call retried once
+        for _ in range(2):
+            pool = self.pool
+            try:
+                return self._submit(pool, function, *args).result()
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+        raise self._unavailable()
+
+    async def _run_async(self, function, *args):
+        for _ in range(2):
+            pool = self.pool
+            try:
+                return await asyncio.wrap_future(
+                    self._submit(pool, function, *args))
+            except BrokenProcessPool:
+                self._reset_pool(pool)
+        raise self._unavailable()
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return self._run(_verify, plain_password, hashed_password)
+
+    async def hash_async(self, password: str) -> str:
+        return await self._run_async(_hash, password, self.rounds)
+
+    async def verify_async(self, plain_password: str,
+                           hashed_password: str) -> bool:
+        return await self._run_async(
+            _verify, plain_password, hashed_password)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return hash_cost(hashed_password) != self.rounds
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "rounds": self.rounds,
+            "rejected": counters.get(f"{self.name}.rejected", 0),
+            "pool_restarts": counters.get(f"{self.name}.pool_restarts", 0)
+        }
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,154 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from src.config import Config
+from src.utils.metrics import metrics
+
+
+def _to_legacy(past_key_values):
+    """Normalizes a transformers Cache object to ((key, value), ...)."""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        return past_key_values.to_legacy_cache()
+    return tuple(tuple(layer) for layer in past_key_values)
+
+
+def crop_past_key_values(past_key_values, length: int):
+    return tuple(
+        (key[:, :, :length], value[:, :, :length])
+        for key, value in past_key_values
+    )
+
+
+def hash_token_ids(token_ids) -> str:
+    return hashlib.sha1(token_ids.cpu().numpy().tobytes()).hexdigest()
+
+
+class _CacheEntry:
+    __slots__ = ("token_ids", "prefix_hash", "past_key_values", "nbytes")
+
+    def __init__(self, token_ids, past_key_values):
+        self.token_ids = token_ids
+        self.prefix_hash = hash_token_ids(token_ids)
+        self.past_key_values = past_key_values
+        self.nbytes = sum(
+            tensor.numel() * tensor.element_size()
+            for layer in past_key_values for tensor in layer
+        )
+
+
+class PrefixCache:
+    """LRU of each chat's past_key_values, bounded by a memory budget.
+
+    An entry holds the token ids its keys/values were computed for. A new
+    turn reuses the entry only for the part of those ids it shares with
+    the new conversation; anything that diverged (a trimmed reply, history
+    that fell out of the token budget) is cropped, and when too little is
+    shared the caller falls back to a full prefill.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = Config.PREFIX_CACHE_MAX_MB * 1024 * 1024,
+        min_reuse_tokens: int = 16,
+        name: str = "prefix_cache"
+    ):
+        self.max_bytes = max_bytes
+        self.min_reuse_tokens = min_reuse_tokens
+        self.name = name
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, chat_id: int, token_ids):
+        """Finds the reusable prefix for a chat's next prompt.
+
+        Args:
+            chat_id: Chat the prompt belongs to
+            token_ids: 1D tensor of the full prompt token ids
+
+        Returns:
+            A tuple, (past_key_values|None, reused_token_count)
+        """
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None:
+                self._entries.move_to_end(chat_id)
+        if entry is None:
+            metrics.increment(f"{self.name}.misses")
+            return (None, 0)
+
+        cached_ids = entry.token_ids.to(token_ids.device)
+        # Leave at least one new token for the model to process
+        length = min(len(cached_ids), len(token_ids) - 1)
+        if length > 0 and hash_token_ids(token_ids[:length]) \
+                == entry.prefix_hash:
+            shared = length
+        else:
+            mismatch = (cached_ids[:length] != token_ids[:length]).nonzero()
+            shared = int(mismatch[0]) if len(mismatch) else length
+            metrics.increment(f"{self.name}.partial_matches")
+
+        if shared < self.min_reuse_tokens:
+            metrics.increment(f"{self.name}.mismatches")
+            self.invalidate(chat_id)
+            return (None, 0)
+
+        metrics.increment(f"{self.name}.hits")
+        metrics.increment(f"{self.name}.reused_tokens", shared)
+        past_key_values = entry.past_key_values
+        if shared < len(cached_ids):
+            past_key_values = crop_past_key_values(past_key_values, shared)
+        return (past_key_values, shared)
+
+    def store(self, chat_id: int, token_ids, past_key_values):
+        """Caches keys/values computed for token_ids (1D tensor)."""
+        past_key_values = _to_legacy(past_key_values)
+        length = past_key_values[0][0].shape[2]
+        entry = _CacheEntry(token_ids[:length].detach(), past_key_values)
+        if entry.nbytes > self.max_bytes:
+            self.invalidate(chat_id)
+            return
+
+        with self._lock:
+            previous = self._entries.pop(chat_id, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[chat_id] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes:
+                (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                metrics.increment(f"{self.name}.evictions")
+
+    def rename(self, key, chat_id: int):
+        """Moves an entry stored under a temporary key to its chat id.
+
+        A new chat has no id until its first turn is saved; that turn is
+        generated under a temporary key and renamed once the id exists.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            previous = self._entries.pop(chat_id, None)
+            if previous is not None:
+                self.nbytes -= previous.nbytes
+            self._entries[chat_id] = entry
+
+    def invalidate(self, chat_id: int):
+        with self._lock:
+            entry = self._entries.pop(chat_id, None)
+            if entry is not None:
+                self.nbytes -= entry.nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes
+            }
+
+
+prefix_cache = PrefixCache()
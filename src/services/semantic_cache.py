@@ -0,0 +1,146 @@
+import random
+import re
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.config import Config
+from src.services.inference import model_registry
+from src.utils.metrics import metrics
+
+
+# Prompts mentioning contact details or names are never cached
+PERSONAL_PATTERN = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.]+"
+    r"|https?://"
+    r"|\d{3,}"
+    r"|\b(names?|named|i am called|i'm called|call me)\b",
+    re.IGNORECASE
+)
+
+
+def is_cacheable(prompt: str, response: str) -> bool:
+    return not (
+        PERSONAL_PATTERN.search(prompt) or PERSONAL_PATTERN.search(response)
+    )
+
+
+class SemanticCache:
+    """Nearest-neighbour cache of responses to first prompts of a chat.
+
+    Prompt embeddings are normalized and kept in a fixed-size NumPy matrix,
+    so a lookup is one matrix-vector product. Entries expire after
+    `ttl_seconds`; when the matrix is full the least recently used entry
+    is replaced. A hit picks randomly among the closest matches above the
+    threshold so repeated prompts do not always get the same reply.
+    """
+
+    def __init__(
+        self,
+        embedder=None,
+        threshold: float = Config.SEMANTIC_CACHE_THRESHOLD,
+        max_entries: int = Config.SEMANTIC_CACHE_MAX_ENTRIES,
+        ttl_seconds: int = Config.SEMANTIC_CACHE_TTL_SECONDS,
+        variants: int = 3,
+        name: str = "semantic_cache"
+    ):
+        self._embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.variants = variants
+        self.name = name
+        self._lock = threading.Lock()
+        self._embeddings = None
+        self._responses = [None] * max_entries
+        self._expires_at = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+
+    @property
+    def embedder(self):
+        return self._embedder or model_registry.embedder
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.embedder.encode(
+            [text], normalize_embeddings=True)[0].astype(np.float32)
+
+    def lookup(self, prompt: str) -> Tuple[Optional[str], np.ndarray]:
+        """Finds a cached response for a semantically similar prompt.
+
+        Returns:
+            A tuple, (response|None, prompt_embedding); the embedding can
+            be passed back to `add` to avoid encoding the prompt twice.
+        """
+        embedding = self.embed(prompt)
+        now = time.time()
+        with self._lock:
+            if self._embeddings is None:
+                metrics.increment(f"{self.name}.misses")
+                return (None, embedding)
+
+            similarities = self._embeddings @ embedding
+            similarities[self._expires_at <= now] = -1
+            candidates = np.flatnonzero(similarities >= self.threshold)
+            if len(candidates) == 0:
+                metrics.increment(f"{self.name}.misses")
+                return (None, embedding)
+
+            closest = candidates[
+                np.argsort(similarities[candidates])[::-1][:self.variants]]
+            index = random.choice(closest)
+            self._last_used[index] = now
+            metrics.increment(f"{self.name}.hits")
+            return (self._responses[index], embedding)
+
+    def add(self, prompt: str, response: str,
+            embedding: np.ndarray = None):
+        if not is_cacheable(prompt, response):
+            metrics.increment(f"{self.name}.skipped_personal")
+            return
+        if embedding is None:
+            embedding = self.embed(prompt)
+
+        now = time.time()
+        with self._lock:
+            if self._embeddings is None:
+                self._embeddings = np.zeros(
+                    (self.max_entries, len(embedding)), dtype=np.float32)
+
+            expired = np.flatnonzero(self._expires_at <= now)
+            if len(expired):
+                index = expired[0]
+            else:
+                index = int(np.argmin(self._last_used))
+                metrics.increment(f"{self.name}.evictions")
+
+            self._embeddings[index] = embedding
+            self._responses[index] = response
+            self._expires_at[index] = now + self.ttl_seconds
+            self._last_used[index] = now
+
+    def clear(self):
+        with self._lock:
+            self._embeddings = None
+            self._responses = [None] * self.max_entries
+            self._expires_at[:] = 0
+            self._last_used[:] = 0
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        hits = counters.get(f"{self.name}.hits", 0)
+        misses = counters.get(f"{self.name}.misses", 0)
+        with self._lock:
+            entries = int(np.count_nonzero(self._expires_at > time.time()))
+        return {
+            "enabled": Config.SEMANTIC_CACHE_ENABLED,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0
+        }
+
+
+semantic_cache = SemanticCache()
@@ -0,0 +1,96 @@
+from typing import Dict, List
+
+import numpy as np
+
+from src.config import Config
+from src.services.inference import model_registry
+from src.utils.batching import MicroBatcher
+
+
+Scores = List[Dict[str, float]]
+
+# Fixed order of the packed emotion vector stored on each prompt
+GO_EMOTIONS_LABELS = (
+    "admiration", "amusement", "anger", "annoyance", "approval", "caring",
+    "confusion", "curiosity", "desire", "disappointment", "disapproval",
+    "disgust", "embarrassment", "excitement", "fear", "gratitude", "grief",
+    "joy", "love", "nervousness", "optimism", "pride", "realization",
+    "relief", "remorse", "sadness", "surprise", "neutral",
+)
+EMOTION_INDEX = {label: i for (i, label) in enumerate(GO_EMOTIONS_LABELS)}
+# Little-endian float16, 2 bytes per emotion
+EMOTION_DTYPE = np.dtype("<f2")
+
+
+def pack_scores(scores: Scores) -> bytes:
+    """Packs a classifier result into a float16 vector in label order.
+
+    Labels the classifier did not return are stored as 0.
+    """
+    vector = np.zeros(len(GO_EMOTIONS_LABELS), dtype=EMOTION_DTYPE)
+    for score in scores:
+        index = EMOTION_INDEX.get(score["label"])
+        if index is not None:
+            vector[index] = score["score"]
+    return vector.tobytes()
+
+
+def unpack_scores(blobs: List[bytes]) -> np.ndarray:
+    """Unpacks packed emotion vectors into an (n, labels) float32 matrix."""
+    return np.frombuffer(
+        b"".join(blobs), dtype=EMOTION_DTYPE
+    ).reshape(-1, len(GO_EMOTIONS_LABELS)).astype(np.float32)
+
+
+class SentimentClassifier:
+    """Micro-batching wrapper around the go_emotions text classifier.
+
+    `classify` is for request handlers: concurrent calls are coalesced
+    into one pipeline call. `classify_many` is for offline jobs that
+    already hold a list of texts and want them scored in large batches.
+    Results are the pipeline's label/score dicts, highest score first.
+    """
+
+    def __init__(
+        self,
+        text_classifier=None,
+        max_batch_size: int = Config.SENTIMENT_MAX_BATCH_SIZE,
+        max_wait_ms: float = Config.SENTIMENT_MAX_WAIT_MS,
+        name: str = "sentiment"
+    ):
+        self._text_classifier = text_classifier
+        self.max_batch_size = max_batch_size
+        self.batcher = MicroBatcher(
+            self._classify_batch,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            name=name
+        )
+
+    @property
+    def text_classifier(self):
+        return self._text_classifier or model_registry.text_classifier
+
+    def _classify_batch(self, texts: List[str]) -> List[Scores]:
+        return self.text_classifier(
+            texts,
+            batch_size=len(texts),
+            truncation=True
+        )
+
+    def classify(self, text: str, top_k: int = None,
+                 timeout: float = None) -> Scores:
+        scores = self.batcher.run(text, timeout=timeout)
+        return scores[:top_k] if top_k else scores
+
+    def classify_many(self, texts: List[str], batch_size: int = None,
+                      top_k: int = None) -> List[Scores]:
+        results = self.text_classifier(
+            texts,
+            batch_size=batch_size or self.max_batch_size,
+            truncation=True
+        )
+        return [scores[:top_k] if top_k else scores for scores in results]
+
+
+sentiment_classifier = SentimentClassifier()
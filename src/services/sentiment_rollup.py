@@ -0,0 +1,158 @@
+from datetime import date, datetime
+from typing import Dict, List
+
+from sqlalchemy import Date, delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.models.chat import Chat, Prompt, Sentiment, SentimentDailyRollup
+from src.schemas.chat import SentimentAggregateSchema
+
+
+def _upsert(dialect_name: str):
+    """INSERT ... ON CONFLICT that adds to an existing day's totals."""
+    table = SentimentDailyRollup.__table__
+    if dialect_name == "postgresql":
+        statement = postgresql.insert(table)
+        greatest = func.greatest
+    elif dialect_name == "sqlite":
+        statement = sqlite.insert(table)
+        # SQLite's multi-argument max() is a scalar function
+        greatest = func.max
+    else:
+        raise Exception(
+            f"Sentiment rollups are not supported on {dialect_name}")
+
+    return statement.on_conflict_do_update(
+        index_elements=["user_id", "day", "sentiment"],
+        set_={
+            "count": table.c.count + statement.excluded.count,
+            "score_sum": table.c.score_sum + statement.excluded.score_sum,
+            "score_max": greatest(
+                table.c.score_max, statement.excluded.score_max),
+        }
+    )
+
+
+def _bucket_expression(dialect_name: str, bucket: str):
+    """The first day of the bucket a rollup day falls in."""
+    day = SentimentDailyRollup.day
+    if bucket == "day":
+        return day
+    if dialect_name == "postgresql":
+        return func.date_trunc(bucket, day).cast(Date)
+    # Weeks start on Monday, as date_trunc('week') does
+    if bucket == "week":
+        return func.date(day, "weekday 0", "-6 days", type_=Date)
+    return func.date(day, "start of month", type_=Date)
+
+
+class SentimentRollupService:
+    """Daily per-user emotion totals, kept up to date on every insert.
+
+    Aggregates over a date range read these rollups instead of joining
+    every Sentiment row back to its prompt and chat.
+    """
+
+    @staticmethod
+    def record(session, user_id: int, sentiment_rows: List[dict]):
+        """Adds freshly inserted sentiments to their day's rollups.
+
+        Runs in the caller's transaction, so the rollups commit or roll
+        back together with the sentiments.
+        """
+        if user_id is None or not sentiment_rows:
+            return
+
+        totals: Dict[tuple, dict] = {}
+        for row in sentiment_rows:
+            key = (row["created_at"].date(), row["sentiment"])
+            total = totals.setdefault(key, {
+                "user_id": user_id,
+                "day": key[0],
+                "sentiment": key[1],
+                "count": 0,
+                "score_sum": 0.0,
+                "score_max": 0.0,
+            })
+            total["count"] += 1
+            total["score_sum"] += row["score"]
+            total["score_max"] = max(total["score_max"], row["score"])
+
+        session.execute(
+            _upsert(session.get_bind().dialect.name), list(totals.values()))
+
+    @staticmethod
+    def backfill(session, user_id: int = None) -> int:
+        """Rebuilds the rollups from the sentiments table.
+
+        Returns:
+            The number of rollup rows written
+        """
+        clear = delete(SentimentDailyRollup)
+        totals = select(
+            Chat.owner_id,
+            func.date(Sentiment.created_at, type_=Date),
+            Sentiment.sentiment,
+            func.count(Sentiment.id),
+            func.sum(Sentiment.score),
+            func.max(Sentiment.score),
+        ).select_from(Sentiment)\
+            .join(Sentiment.prompt)\
+            .join(Prompt.chat)\
+            .where(Chat.owner_id.is_not(None))
+        if user_id is not None:
+            clear = clear.where(SentimentDailyRollup.user_id == user_id)
+            totals = totals.where(Chat.owner_id == user_id)
+        totals = totals.group_by(
+            Chat.owner_id,
+            func.date(Sentiment.created_at),
+            Sentiment.sentiment
+        )
+
+        session.execute(clear)
+        result = session.execute(
+            insert(SentimentDailyRollup).from_select(
+                ["user_id", "day", "sentiment", "count", "score_sum",
+                 "score_max"],
+                totals
+            )
+        )
+        return result.rowcount
+
+    @staticmethod
+    def aggregate_query(session, user_id: int, start_date: date,
+                        end_date: date, bucket: str = "day"):
+        bucket_start = _bucket_expression(
+            session.get_bind().dialect.name, bucket).label("bucket")
+        count = func.sum(SentimentDailyRollup.count)
+        return session.query(
+            bucket_start,
+            SentimentDailyRollup.sentiment,
+            count.label("count"),
+            (func.sum(SentimentDailyRollup.score_sum) / count)
+            .label("mean_score"),
+            func.max(SentimentDailyRollup.score_max).label("max_score"),
+        ).where(
+            SentimentDailyRollup.user_id == user_id,
+            SentimentDailyRollup.day >= start_date,
+            SentimentDailyRollup.day <= end_date
+        ).group_by(
+            bucket_start, SentimentDailyRollup.sentiment
+        ).order_by(
+            bucket_start, SentimentDailyRollup.sentiment
+        )
+
+    @staticmethod
+    def aggregate(session, user_id: int, start_date: datetime,
+                  end_date: datetime, bucket: str = "day") -> List[dict]:
+        """Per bucket and emotion count, mean and max score.
+
+        Days are UTC days; a partial first or last bucket only covers the
+        days inside the range.
+        """
+        rows = SentimentRollupService.aggregate_query(
+            session, user_id, start_date.date(), end_date.date(), bucket)
+        return [
+            SentimentAggregateSchema.from_orm(row).model_dump()
+            for row in rows
+        ]
@@ -2,7 +2,12 @@ from enum import Enum
 import string
 import secrets
 import base64
+import hashlib
+import threading
+import time
+from collections import deque
 from datetime import timedelta, datetime
+from sqlalchemy import func, or_, select
 from sqlalchemy.exc import NoResultFound
 
 from src.models.token import (
@@ -14,32 +19,206 @@ from src.schemas.token import (
     TokenSchema,
     TokenTypeEnum
 )
-from src.models import DatabaseSession
+from src.models import DatabaseSession, AsyncDatabaseSession
+from src.config import Config
+from src.utils.bloom import BloomFilter
+from src.utils.broadcast import broadcast
+from src.utils.logger import logger
+from src.utils.metrics import metrics
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class BlacklistFilter:
+    """Per-worker Bloom filter of the blacklisted token hashes.
+
+    A token missing from the filter is not blacklisted, so only the rare
+    positives are checked against the database. Until the filter is
+    loaded every lookup goes to the database. With BROADCAST_REDIS_URL
+    set, new digests are broadcast to the other workers. Rows blacklisted by other workers are also picked up every
+    `refresh_seconds`; each refresh re-reads
+    the previous interval's rows too, so rows committed out of id order
+    are not missed. The filter is rebuilt from the unexpired rows every
+    `rebuild_seconds`, after this worker purged expired rows (see
+    `TokenMaintenance`) and whenever it fills past its capacity.
+    """
+
+    def __init__(
+        self,
+        capacity: int = Config.BLACKLIST_BLOOM_CAPACITY,
+        error_rate: float = Config.BLACKLIST_BLOOM_ERROR_RATE,
+        refresh_seconds: float = Config.BLACKLIST_REFRESH_SECONDS,
+        rebuild_seconds: float = Config.BLACKLIST_REBUILD_SECONDS,
+        name: str = "token_blacklist"
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_seconds = refresh_seconds
+        self.rebuild_seconds = rebuild_seconds
+        self._rebuilt_at = None
+        self.name = name
+        self.bloom = None
+        self._seen_ids = deque([0, 0], maxlen=2)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def might_contain(self, token_hash: str) -> bool:
+        bloom = self.bloom
+        return bloom is None or bytes.fromhex(token_hash) in bloom
+
+    def add(self, token_hash: str):
+        bloom = self.bloom
+        if bloom is not None:
+            bloom.add(bytes.fromhex(token_hash))
+
+    def rebuild(self):
+        now = datetime.utcnow()
+        with DatabaseSession().withSession() as session:
+            last_id = session.query(
+                func.coalesce(func.max(TokenBlacklist.id), 0)).scalar()
+            live = session.query(TokenBlacklist.token_hash).where(
+                or_(TokenBlacklist.expires_at.is_(None),
+                    TokenBlacklist.expires_at > now),
+                TokenBlacklist.id <= last_id
+            )
+            count = live.count()
+            bloom = BloomFilter(
+                max(self.capacity, 2 * count), self.error_rate)
+            for (token_hash,) in live.yield_per(10000):
+                bloom.add(bytes.fromhex(token_hash))
+
+        with self._lock:
+            self.bloom = bloom
+            self._seen_ids.extend([last_id, last_id])
+            self._rebuilt_at = time.monotonic()
+        metrics.increment(f"{self.name}.rebuilds")
+
+    def refresh(self):
+        bloom = self.bloom
+        if bloom is None or bloom.count > bloom.capacity or \
+                time.monotonic() - self._rebuilt_at >= self.rebuild_seconds:
+            return self.rebuild()
+
+        with DatabaseSession().withSession() as session:
+            rows = session.query(
+                TokenBlacklist.id, TokenBlacklist.token_hash
+            ).where(TokenBlacklist.id > self._seen_ids[0]).all()
+        for row in rows:
+            self.add(row.token_hash)
+        with self._lock:
+            self._seen_ids.append(
+                max([self._seen_ids[-1], *(row.id for row in rows)]))
+
+    def _maintain(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as E:
+                logger.error(f"::> Token blacklist maintenance: {E}")
+            time.sleep(self.refresh_seconds)
+
+    def _on_broadcast(self, token_hash: str):
+        try:
+            self.add(token_hash)
+        except ValueError:
+            logger.error(f"::> Invalid blacklist broadcast: {token_hash}")
+
+    def start(self):
+        """Loads the filter and keeps it in sync, in the background."""
+        with self._lock:
+            if self._thread is None:
+                broadcast.subscribe(self.name, self._on_broadcast)
+                self._thread = threading.Thread(
+                    target=self._maintain,
+                    name="token-blacklist",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        negatives = counters.get(f"{self.name}.bloom_negatives", 0)
+        false_positives = counters.get(f"{self.name}.false_positives", 0)
+        bloom = self.bloom
+        return {
+            "loaded": bloom is not None,
+            "entries": bloom.count if bloom else 0,
+            "capacity": bloom.capacity if bloom else self.capacity,
+            "memory_bytes": bloom.nbytes if bloom else 0,
+            "expected_false_positive_rate":
+                bloom.false_positive_rate() if bloom else 0.0,
+            "bloom_negatives": negatives,
+            "false_positives": false_positives,
+            "observed_false_positive_rate":
+                false_positives / (negatives + false_positives)
+                if negatives + false_positives else 0.0
+        }
+
+
+blacklist_filter = BlacklistFilter()
 
 
 class TokenBlacklistService:
+    @staticmethod
+    def _screen(token_hash: str) -> bool:
+        """False when the Bloom filter rules the token out."""
+        if blacklist_filter.might_contain(token_hash):
+            return True
+        metrics.increment(f"{blacklist_filter.name}.bloom_negatives")
+        return False
+
+    @staticmethod
+    def _record(blacklisted: bool) -> bool:
+        if not blacklisted and blacklist_filter.bloom is not None:
+            metrics.increment(f"{blacklist_filter.name}.false_positives")
+        return blacklisted
+
     @staticmethod
     def is_blacklisted(token: str) -> bool:
-        is_blacklisted = False
+        token_hash = hash_token(token)
+        if not TokenBlacklistService._screen(token_hash):
+            return False
         with DatabaseSession().withSession() as session:
-            blacklisted_token = session.query(TokenBlacklist).where(
-                TokenBlacklist.token == token).first()
-            if blacklisted_token:
-                is_blacklisted = True
-        return is_blacklisted
+            blacklisted_token = session.query(TokenBlacklist.id).where(
+                TokenBlacklist.token_hash == token_hash).first()
+        return TokenBlacklistService._record(blacklisted_token is not None)
+
+    @staticmethod
+    async def is_blacklisted_async(token: str) -> bool:
+        token_hash = hash_token(token)
+        if not TokenBlacklistService._screen(token_hash):
+            return False
+        async with AsyncDatabaseSession().withSession() as session:
+            blacklisted_token = (await session.execute(
+                select(TokenBlacklist.id).where(
+                    TokenBlacklist.token_hash == token_hash).limit(1)
+            )).first()
+        return TokenBlacklistService._record(blacklisted_token is not None)
 
     @staticmethod
-    def blacklist_token(token: str) -> TokenBlacklistSchema:
+    def blacklist_token(
+        token: str, expires_at: datetime = None
+    ) -> TokenBlacklistSchema:
+        """Blacklists a token until `expires_at`, its exp claim.
+
+        Without it the token is kept for the refresh token lifetime.
+        """
+        token_hash = hash_token(token)
         with DatabaseSession().withSession() as session:
             blacklist_token_orm = TokenBlacklist(
-                token=token,
-                expires_at=datetime.utcnow() + timedelta(days=30)
+                token_hash=token_hash,
+                expires_at=expires_at or datetime.utcnow() + timedelta(
+                    days=Config.REFRESH_TOKEN_EXPIRATION_DAYS)
             )
             session.add(blacklist_token_orm)
             session.commit()
             blacklist_token = TokenBlacklistSchema.from_orm(
                 blacklist_token_orm)
-            return blacklist_token
+        blacklist_filter.add(token_hash)
+        broadcast.publish(blacklist_filter.name, token_hash)
+        return blacklist_token
 
 
 class TokenCharacterType(Enum):
@@ -130,34 +309,55 @@ class TokenService:
             A tuple, (token_exists, token|None)
         """
 
-        def get_query(session):
-            # Build query based on encoded or non-encoded token
-            if is_encoded:
-                (token_str, encoded_id) = token.split("_")
-                id = TokenService.decode_number(encoded_id)
-                return session.query(Token).where(
-                    Token.id == id,
-                    Token.type == type,
-                    Token.token == token_str,
-                    Token.expires_at > datetime.utcnow()
-                )
-            else:
-                return session.query(Token).where(
-                    Token.user_id == user_id,
-                    Token.type == type,
-                    Token.token == token,
-                    Token.expires_at > datetime.utcnow()
-                )
-
         # Use with_session and handle exceptions
         with DatabaseSession().withSession() as session:
             try:
-                token_orm = get_query(session).one()
+                token_orm = session.query(Token).where(
+                    *TokenService._token_filters(
+                        token, type, is_encoded, user_id)
+                ).one()
                 token = TokenSchema.from_orm(token_orm)
                 return (True, token)
             except NoResultFound:
                 return (False, None)
 
+    @staticmethod
+    async def get_by_encoded_token_async(
+        token: str,
+        type: TokenTypeEnum,
+        is_encoded=True,
+        user_id=None
+    ) -> (bool, TokenSchema):
+        """Async variant of `get_by_encoded_token`."""
+        async with AsyncDatabaseSession().withSession() as session:
+            token_orm = (await session.execute(
+                select(Token).where(*TokenService._token_filters(
+                    token, type, is_encoded, user_id))
+            )).scalar_one_or_none()
+            if token_orm is None:
+                return (False, None)
+            return (True, TokenSchema.from_orm(token_orm))
+
+    @staticmethod
+    def _token_filters(token: str, type: TokenTypeEnum, is_encoded, user_id):
+        # Build filters based on encoded or non-encoded token
+        if is_encoded:
+            (token_str, encoded_id) = token.split("_")
+            id = TokenService.decode_number(encoded_id)
+            return (
+                Token.id == id,
+                Token.type == type,
+                Token.token == token_str,
+                Token.expires_at > datetime.utcnow()
+            )
+        else:
+            return (
+                Token.user_id == user_id,
+                Token.type == type,
+                Token.token == token,
+                Token.expires_at > datetime.utcnow()
+            )
+
     @staticmethod
     def encode_number(num):
         """Encodes a number to a base64 string.
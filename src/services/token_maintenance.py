@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+from src.config import Config
+from src.models import DatabaseSession
+from src.models.token import Token, TokenBlacklist
+from src.services.token import blacklist_filter
+from src.utils.logger import logger
+from src.utils.metrics import metrics
+
+
+class TokenMaintenance:
+    """Deletes expired `tokens` and `token_blacklists` rows in the
+    background.
+
+    Expired rows are deleted `batch_size` at a time, each batch in its
+    own short transaction followed by a `batch_pause_seconds` pause, so
+    the purge never holds locks for long or starves other writers. Both
+    tables then only grow with the tokens still in use. This worker's
+    blacklist Bloom filter is rebuilt after blacklist rows were removed;
+    the other workers' filters drop them at their next periodic rebuild.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = Config.TOKEN_PURGE_ENABLED,
+        interval_seconds: float = Config.TOKEN_PURGE_INTERVAL_SECONDS,
+        batch_size: int = Config.TOKEN_PURGE_BATCH_SIZE,
+        batch_pause_seconds: float = Config.TOKEN_PURGE_BATCH_PAUSE_SECONDS,
+        name: str = "token_maintenance"
+    ):
+        self.enabled = enabled
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.batch_pause_seconds = batch_pause_seconds
+        self.name = name
+        self.last_run = None
+        # Duration of the most recent batches, in ms
+        self._batch_ms = deque(maxlen=50)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _purge_batch(self, model, now: datetime) -> int:
+        started = time.perf_counter()
+        with DatabaseSession().withSession() as session:
+            ids = session.execute(
+                # Ordered by expiry so the expires_at index is used
+                select(model.id).where(model.expires_at < now)
+                .order_by(model.expires_at).limit(self.batch_size)
+            ).scalars().all()
+            if ids:
+                session.execute(delete(model).where(model.id.in_(ids)))
+                session.commit()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.observe(f"{self.name}.batch_ms", elapsed_ms)
+        with self._lock:
+            self._batch_ms.append(round(elapsed_ms, 2))
+        return len(ids)
+
+    def purge(self, model) -> int:
+        """Deletes the rows of `model` that expired before now.
+
+        Returns:
+            Rows deleted
+        """
+        now = datetime.utcnow()
+        purged = 0
+        while True:
+            deleted = self._purge_batch(model, now)
+            purged += deleted
+            if deleted < self.batch_size:
+                break
+            time.sleep(self.batch_pause_seconds)
+        metrics.increment(f"{self.name}.{model.__tablename__}", purged)
+        return purged
+
+    def run(self) -> dict:
+        """Purges both tables once.
+
+        Returns:
+            Rows deleted per table
+        """
+        started = time.perf_counter()
+        purged = {
+            Token.__tablename__: self.purge(Token),
+            TokenBlacklist.__tablename__: self.purge(TokenBlacklist)
+        }
+        if purged[TokenBlacklist.__tablename__]:
+            blacklist_filter.rebuild()
+        with self._lock:
+            self.last_run = {
+                "finished_at": datetime.utcnow().isoformat(),
+                "duration_ms": round(
+                    (time.perf_counter() - started) * 1000, 2),
+                "purged": purged
+            }
+        return purged
+
+    def _maintain(self):
+        while True:
+            try:
+                self.run()
+            except Exception as E:
+                logger.error(f"::> Token maintenance: {E}")
+            time.sleep(self.interval_seconds)
+
+    def start(self):
+        """Purges every `interval_seconds`, in the background."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._maintain,
+                    name="token-maintenance",
+                    daemon=True
+                )
+                self._thread.start()
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        with self._lock:
+            last_run = self.last_run
+            batch_ms = list(self._batch_ms)
+        return {
+            "enabled": self.enabled,
+            "interval_seconds": self.interval_seconds,
+            "batch_size": self.batch_size,
+            "purged": {
+                table: counters.get(f"{self.name}.{table}", 0)
+                for table in (Token.__tablename__,
+                              TokenBlacklist.__tablename__)
+            },
+            "last_run": last_run,
+            "recent_batch_ms": batch_ms
+        }
+
+
+token_maintenance = TokenMaintenance()
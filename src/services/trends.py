@@ -0,0 +1,253 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import List, Tuple
+
+import numpy as np
+from fastapi import status
+
+from src.config import Config
+from src.services.chat import ChatService
+from src.services.sentiment import EMOTION_INDEX, GO_EMOTIONS_LABELS
+from src.utils import CustomError
+from src.utils.metrics import metrics
+
+
+# Floor for the pooled standard deviation of a change-point window, so a
+# jump between two flat stretches does not score infinitely high
+MIN_CHANGE_STD = 0.05
+
+
+def daily_means(timestamps: np.ndarray, scores: np.ndarray):
+    """Averages per-prompt emotion vectors into one row per UTC day.
+
+    Only days with at least one prompt get a row.
+
+    Returns:
+        A tuple, (days, prompt_counts, means)
+    """
+    (days, inverse, counts) = np.unique(
+        timestamps.astype("datetime64[D]"),
+        return_inverse=True,
+        return_counts=True
+    )
+    sums = np.zeros((len(days), scores.shape[1]), dtype=np.float64)
+    np.add.at(sums, inverse, scores)
+    return (days, counts, sums / counts[:, None])
+
+
+def _cumsum(x: np.ndarray) -> np.ndarray:
+    return np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)])
+
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    """Trailing mean over `window` rows; shorter at the start."""
+    end = np.arange(1, len(x) + 1)
+    start = np.maximum(end - window, 0)
+    sums = _cumsum(x)
+    return (sums[end] - sums[start]) / (end - start)[:, None]
+
+
+def rolling_std(x: np.ndarray, window: int) -> np.ndarray:
+    mean = rolling_mean(x, window)
+    return np.sqrt(np.clip(rolling_mean(x ** 2, window) - mean ** 2, 0, None))
+
+
+def ewma(x: np.ndarray, alpha: float) -> np.ndarray:
+    """Exponentially weighted mean of every column, seeded with row 0."""
+    if len(x) == 0:
+        return x
+    from scipy.signal import lfilter
+
+    # y[t] = alpha * x[t] + (1 - alpha) * y[t - 1]
+    (smoothed, _) = lfilter(
+        [alpha], [1, alpha - 1], x, axis=0, zi=(1 - alpha) * x[:1])
+    return smoothed
+
+
+def change_points(x: np.ndarray, window: int, threshold: float):
+    """Finds rows where a column's mean shifts.
+
+    Every row t is scored by the difference between the means of the
+    `window` rows before and from t, in units of their pooled standard
+    deviation (a two-sample t statistic). Rows scoring at least
+    `threshold` that are the highest within `window` rows are returned.
+
+    Returns:
+        A tuple, (rows, columns, before, after, scores)
+    """
+    n = len(x)
+    if n < 2 * window:
+        empty = np.array([], dtype=int)
+        return (empty, empty, np.array([]), np.array([]), np.array([]))
+
+    sums = _cumsum(x)
+    squares = _cumsum(x ** 2)
+    t = np.arange(window, n - window + 1)
+    before = (sums[t] - sums[t - window]) / window
+    after = (sums[t + window] - sums[t]) / window
+    variance = (
+        (squares[t] - squares[t - window]) / window - before ** 2
+        + (squares[t + window] - squares[t]) / window - after ** 2
+    ) / 2
+    std = np.maximum(np.sqrt(np.clip(variance, 0, None)), MIN_CHANGE_STD)
+    scores = np.abs(after - before) / std * np.sqrt(window / 2)
+
+    padded = np.pad(scores, ((window, window), (0, 0)),
+                    constant_values=-np.inf)
+    local_max = np.lib.stride_tricks.sliding_window_view(
+        padded, 2 * window + 1, axis=0).max(axis=-1)
+    (rows, columns) = np.nonzero(
+        (scores >= threshold) & (scores == local_max))
+    return (
+        t[rows],
+        columns,
+        before[rows, columns],
+        after[rows, columns],
+        scores[rows, columns]
+    )
+
+
+class TrendMemo:
+    """Per-user memo of computed trends.
+
+    Entries expire after `ttl_seconds` and all of a user's entries are
+    dropped when one of their prompts is scored. Users are evicted least
+    recently used first beyond `max_users`.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = Config.TRENDS_CACHE_TTL_SECONDS,
+        max_users: int = Config.TRENDS_CACHE_MAX_USERS,
+        name: str = "trends_cache"
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        self.name = name
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, key: tuple):
+        with self._lock:
+            entry = self._users.get(user_id, {}).get(key)
+            if entry is not None and entry[0] > time.time():
+                self._users.move_to_end(user_id)
+                metrics.increment(f"{self.name}.hits")
+                return entry[1]
+        metrics.increment(f"{self.name}.misses")
+        return None
+
+    def set(self, user_id: int, key: tuple, value):
+        with self._lock:
+            entries = self._users.setdefault(user_id, {})
+            entries[key] = (time.time() + self.ttl_seconds, value)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "entries": sum(len(e) for e in self._users.values()),
+                "max_users": self.max_users
+            }
+
+
+trend_memo = TrendMemo()
+
+
+class MoodTrendService:
+    """Mood trends over a user's daily averaged emotion vectors."""
+
+    @staticmethod
+    def _columns(emotions: List[str] = None) -> List[int]:
+        if not emotions:
+            return list(range(len(GO_EMOTIONS_LABELS)))
+        unknown = [e for e in emotions if e not in EMOTION_INDEX]
+        if unknown:
+            raise CustomError(
+                detail=f"Unknown emotions: {', '.join(unknown)}",
+                status_code=status.HTTP_400_BAD_REQUEST
+            )
+        return [EMOTION_INDEX[emotion] for emotion in emotions]
+
+    @staticmethod
+    def _history(session, user_id: int, start_date: date, end_date: date,
+                 columns: List[int]) -> Tuple[np.ndarray, ...]:
+        (timestamps, scores) = ChatService.emotion_matrix(
+            session,
+            user_id,
+            datetime.combine(start_date, datetime.min.time()),
+            datetime.combine(end_date, datetime.max.time())
+        )
+        return daily_means(timestamps, scores[:, columns])
+
+    @staticmethod
+    def trends(session, user_id: int, start_date: date, end_date: date,
+               window: int = 7, alpha: float = 0.3,
+               emotions: List[str] = None) -> dict:
+        """Daily mean, rolling mean, EWMA and rolling volatility per
+        emotion; each series has one row per day with prompts."""
+        columns = MoodTrendService._columns(emotions)
+        key = ("trends", start_date, end_date, window, alpha, tuple(columns))
+        cached = trend_memo.get(user_id, key)
+        if cached is not None:
+            return cached
+
+        (days, counts, means) = MoodTrendService._history(
+            session, user_id, start_date, end_date, columns)
+        result = {
+            "labels": [GO_EMOTIONS_LABELS[i] for i in columns],
+            "window": window,
+            "alpha": alpha,
+            "days": [str(day) for day in days],
+            "prompt_counts": counts.tolist(),
+            "mean": np.round(means, 4).tolist(),
+            "rolling_mean": np.round(rolling_mean(means, window), 4).tolist(),
+            "ewma": np.round(ewma(means, alpha), 4).tolist(),
+            "volatility": np.round(rolling_std(means, window), 4).tolist(),
+        }
+        trend_memo.set(user_id, key, result)
+        return result
+
+    @staticmethod
+    def change_points(session, user_id: int, start_date: date,
+                      end_date: date, window: int = 7,
+                      threshold: float = 3.0,
+                      emotions: List[str] = None) -> dict:
+        """Days on which an emotion's average level shifted."""
+        columns = MoodTrendService._columns(emotions)
+        key = ("change_points", start_date, end_date, window, threshold,
+               tuple(columns))
+        cached = trend_memo.get(user_id, key)
+        if cached is not None:
+            return cached
+
+        (days, _, means) = MoodTrendService._history(
+            session, user_id, start_date, end_date, columns)
+        (rows, found, before, after, scores) = change_points(
+            means, window, threshold)
+        order = np.lexsort((found, rows))
+        result = {
+            "window": window,
+            "threshold": threshold,
+            "change_points": [
+                {
+                    "day": str(days[rows[i]]),
+                    "sentiment": GO_EMOTIONS_LABELS[columns[found[i]]],
+                    "before": round(float(before[i]), 4),
+                    "after": round(float(after[i]), 4),
+                    "score": round(float(scores[i]), 2)
+                }
+                for i in order
+            ]
+        }
+        trend_memo.set(user_id, key, result)
+        return result
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+
+from src.config import Config
+from src.schemas.user import UserSchema
+from src.utils.broadcast import broadcast
+from src.utils.metrics import metrics
+
+
+class UserCache:
+    """TTL + LRU cache of authenticated users, keyed by user id.
+
+    Code that changes a user must call `invalidate` once the change is
+    committed. With BROADCAST_REDIS_URL set, invalidations are also
+    broadcast and every worker subscribed through `start_listener` drops
+    its copy; without it other workers serve the old user for at most
+    `ttl_seconds`.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = Config.USER_CACHE_ENABLED,
+        ttl_seconds: float = Config.USER_CACHE_TTL_SECONDS,
+        max_entries: int = Config.USER_CACHE_MAX_ENTRIES,
+        name: str = "user_cache"
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.name = name
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, see `set`
+        self.generation = 0
+
+    def get(self, user_id: int) -> UserSchema:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                metrics.increment(f"{self.name}.hits")
+                return entry[1]
+        metrics.increment(f"{self.name}.misses")
+        return None
+
+    def set(self, user: UserSchema, generation: int = None):
+        """Caches a user loaded from the database.
+
+        Pass the `generation` read before the user was loaded: if any
+        invalidation happened since, the user may be stale and is not
+        cached.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[user.id] = (
+                time.monotonic() + self.ttl_seconds, user)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int, publish: bool = True):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self.generation += 1
+        metrics.increment(f"{self.name}.invalidations")
+        if publish:
+            broadcast.publish(self.name, str(user_id))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def _on_broadcast(self, user_id: str):
+        self.invalidate(int(user_id), publish=False)
+
+    def start_listener(self):
+        """Subscribes this worker to invalidations from the others."""
+        if self.enabled:
+            # Entries cached while disconnected may have missed an
+            # invalidation
+            broadcast.subscribe(
+                self.name, self._on_broadcast, on_reconnect=self.clear)
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        hits = counters.get(f"{self.name}.hits", 0)
+        misses = counters.get(f"{self.name}.misses", 0)
+        with self._lock:
+            entries = len(self._entries)
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "invalidations": counters.get(f"{self.name}.invalidations", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0
+        }
+
+
+user_cache = UserCache()
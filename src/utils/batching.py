@@ -0,0 +1,107 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+from src.utils.logger import logger
+from src.utils.metrics import metrics
+
+
+class _PendingItem:
+    __slots__ = ("payload", "future", "enqueued_at")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """Coalesces concurrent calls into batches processed by one worker thread.
+
+    A batch is dispatched once `max_batch_size` items are pending or
+    `max_wait_ms` has passed since the oldest pending item was submitted.
+    `process_batch` receives the payloads in submission order and must
+    return one result per payload.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10,
+        name: str = "batcher"
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def submit(self, payload) -> Future:
+        self._ensure_worker()
+        item = _PendingItem(payload)
+        self._queue.put(item)
+        return item.future
+
+    def run(self, payload, timeout: float = None):
+        """Submits a payload and blocks until its result is available."""
+        return self.submit(payload).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._worker, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> List[_PendingItem]:
+        batch = [self._queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect()
+            dispatched_at = time.perf_counter()
+            metrics.observe(f"{self.name}.batch_size", len(batch))
+            for item in batch:
+                metrics.observe(
+                    f"{self.name}.queue_wait_ms",
+                    (dispatched_at - item.enqueued_at) * 1000
+                )
+
+            try:
+                results = list(self.process_batch(
+                    [item.payload for item in batch]))
+                # Otherwise the callers without a result wait forever
+                if len(results) != len(batch):
+                    raise ValueError(
+                        f"{len(results)} results for a batch of "
+                        f"{len(batch)} items")
+                for item, result in zip(batch, results):
+                    item.future.set_result(result)
+            except Exception as E:
+                logger.error(f"::> {self.name} batch failed: {E}")
+                metrics.increment(f"{self.name}.errors")
+                for item in batch:
+                    item.future.set_exception(E)
+            finally:
+                metrics.observe(
+                    f"{self.name}.batch_ms",
+                    (time.perf_counter() - dispatched_at) * 1000
+                )
@@ -0,0 +1,53 @@
+import math
+import threading
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over sha256 digests.
+
+    Sized for `capacity` items at `error_rate` false positives. Items are
+    digests (bytes of at least 16), whose two 64-bit halves drive the
+    double hashing, so nothing is hashed again. `in` is never wrong for
+    an added item; for other items it is wrong with probability
+    `false_positive_rate()`.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.size = max(8, int(math.ceil(
+            -self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, digest: bytes):
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        return [
+            (first + i * second) % self.size for i in range(self.hashes)
+        ]
+
+    def add(self, digest: bytes):
+        positions = self._positions(digest)
+        with self._lock:
+            for position in positions:
+                self._bits[position >> 3] |= 1 << (position & 7)
+            self.count += 1
+
+    def __contains__(self, digest: bytes) -> bool:
+        bits = self._bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest)
+        )
+
+    def false_positive_rate(self) -> float:
+        """Expected false positive rate at the current fill."""
+        return (1 - math.exp(-self.hashes * self.count / self.size)) \
+            ** self.hashes
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
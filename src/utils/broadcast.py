@@ -0,0 +1,110 @@
+import threading
+import time
+
+from src.config import Config
+from src.utils.logger import logger
+from src.utils.metrics import metrics
+
+
+class Broadcast:
+    """Redis pub/sub channel shared by every worker.
+
+    Messages are "<topic>:<payload>" strings; `subscribe` registers a
+    handler per topic and starts the listener thread. Without
+    `redis_url` nothing is published or received, and callers fall back
+    to whatever they do without it. A worker also receives its own
+    messages.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = Config.BROADCAST_REDIS_URL,
+        channel: str = Config.BROADCAST_CHANNEL,
+        name: str = "broadcast"
+    ):
+        self.redis_url = redis_url
+        self.channel = channel
+        self.name = name
+        self._handlers = {}
+        self._reconnect_handlers = []
+        self._redis = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.redis_url)
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            import redis
+
+            self._redis = redis.Redis.from_url(self.redis_url)
+        return self._redis
+
+    def publish(self, topic: str, payload: str):
+        if not self.enabled:
+            return
+        try:
+            self.redis.publish(self.channel, f"{topic}:{payload}")
+            metrics.increment(f"{self.name}.published")
+        except Exception as E:
+            metrics.increment(f"{self.name}.errors")
+            logger.error(f"::> Broadcast publish to {topic}: {E}")
+
+    def subscribe(self, topic: str, handler, on_reconnect=None):
+        """Calls `handler(payload)` for every message on `topic`.
+
+        `on_reconnect()` is called whenever the channel is (re)joined,
+        messages sent while disconnected are lost.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._handlers[topic] = handler
+            if on_reconnect is not None:
+                self._reconnect_handlers.append(on_reconnect)
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen, name="broadcast", daemon=True)
+                self._listener.start()
+
+    def _handle(self, data: bytes):
+        (topic, _, payload) = data.decode("utf-8").partition(":")
+        handler = self._handlers.get(topic)
+        if handler is None:
+            return
+        metrics.increment(f"{self.name}.received")
+        try:
+            handler(payload)
+        except Exception as E:
+            metrics.increment(f"{self.name}.errors")
+            logger.error(f"::> Broadcast handler for {topic}: {E}")
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for on_reconnect in list(self._reconnect_handlers):
+                    on_reconnect()
+                for message in pubsub.listen():
+                    self._handle(message["data"])
+            except Exception as E:
+                metrics.increment(f"{self.name}.errors")
+                logger.error(f"::> Broadcast listener: {E}")
+                time.sleep(1)
+
+    def stats(self) -> dict:
+        counters = metrics.snapshot()["counters"]
+        return {
+            "enabled": self.enabled,
+            "topics": sorted(self._handlers),
+            "published": counters.get(f"{self.name}.published", 0),
+            "received": counters.get(f"{self.name}.received", 0),
+            "errors": counters.get(f"{self.name}.errors", 0)
+        }
+
+
+broadcast = Broadcast()
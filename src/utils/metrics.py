@@ -0,0 +1,49 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """In-process counters and value summaries, exposed on /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._observations = {}
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            summary = self._observations.get(name)
+            if summary is None:
+                summary = self._observations[name] = {
+                    "count": 0, "sum": 0.0, "min": value, "max": value
+                }
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["min"] = min(summary["min"], value)
+            summary["max"] = max(summary["max"], value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            observations = {
+                name: {
+                    **summary,
+                    "avg": summary["sum"] / summary["count"]
+                }
+                for name, summary in self._observations.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "observations": observations
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._observations.clear()
+
+
+metrics = Metrics()
@@ -0,0 +1,84 @@
+import base64
+import json
+from datetime import datetime
+from typing import Generic, List, Optional, TypeVar
+
+from fastapi import Query, status
+from pydantic import BaseModel
+from sqlalchemy import tuple_
+
+from src.utils import CustomError
+
+
+T = TypeVar("T")
+
+
+class CursorPage(BaseModel, Generic[T]):
+    data: List[T]
+    size: int
+    next_cursor: Optional[str] = None
+
+
+class CursorParams(BaseModel):
+    cursor: Optional[str] = None
+    size: int = 50
+
+
+def cursor_params(
+    cursor: Optional[str] = Query(
+        default=None, description="next_cursor of the previous page"),
+    size: int = Query(default=50, ge=1, le=100)
+) -> CursorParams:
+    return CursorParams(cursor=cursor, size=size)
+
+
+def encode_cursor(created_at: datetime, id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("utf-8")
+
+
+def decode_cursor(cursor: str) -> (datetime, int):
+    try:
+        (created_at, id) = json.loads(base64.urlsafe_b64decode(
+            cursor.encode("utf-8")))
+        return (datetime.fromisoformat(created_at), int(id))
+    except Exception:
+        raise CustomError(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def keyset_paginate_query(query, model, cursor: Optional[str], size: int):
+    """Restricts a query to the page after `cursor`, plus one row."""
+    if cursor:
+        (created_at, id) = decode_cursor(cursor)
+        # Row value comparison lets the (..., created_at, id) index seek
+        query = query.where(
+            tuple_(model.created_at, model.id) < tuple_(created_at, id))
+
+    return query.order_by(
+        model.created_at.desc(), model.id.desc()
+    ).limit(size + 1)
+
+
+def keyset_paginate(query, model, schema, params: CursorParams) -> CursorPage:
+    """Pages a query newest first on (created_at, id) in SQL.
+
+    The cursor is the (created_at, id) of the last row of the previous
+    page, so every page costs one index range scan of `size + 1` rows
+    regardless of how deep it is.
+    """
+    rows = keyset_paginate_query(
+        query, model, params.cursor, params.size).all()
+
+    next_cursor = None
+    if len(rows) > params.size:
+        rows = rows[:params.size]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    return CursorPage(
+        data=[schema.from_orm(row) for row in rows],
+        size=params.size,
+        next_cursor=next_cursor
+    )
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from typing import Annotated
+from datetime import datetime
 
-from src.models import DatabaseSession
+from src.models import DatabaseSession, AsyncDatabaseSession
 from src.models.user import User
 from src.schemas.user import UserPublicSchema
 from src.schemas.token import TokenTypeEnum
@@ -16,6 +18,7 @@ from src.utils import AppUtils, CustomError
 from src.utils.logger import logger
 from src.middlewares.auth import ActiveUser
 from src.services.mail import Emailer
+from src.services.user_cache import user_cache
 
 
 auth_routes = APIRouter(
@@ -39,8 +42,10 @@ class RegisterInput(BaseModel):
 
 # auth views
 @auth_routes.post("/login", status_code=status.HTTP_200_OK)
-def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
-    user = AuthService.authenticate_user(
+async def login(
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+):
+    user = await AuthService.authenticate_user_async(
         form_data.username, form_data.password
     )
 
@@ -63,45 +68,45 @@ def login(form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
 
 
 @auth_routes.post("/register")
-def register(input: RegisterInput):
+async def register(input: RegisterInput):
 
-    with DatabaseSession().withSession() as session:
-        # Validate user does not exists
-        normalized_email = input.email.strip().lower()
-        user_orm = AuthService.get_user_by_email(normalized_email)
-
-        if not user_orm:
-            hashed_password = AuthService.make_hashed_password(input.password)
-            user_orm = User(
-                first_name=input.first_name,
-                last_name=input.last_name,
-                email=normalized_email,
-                password=hashed_password
-            )
-            session.add(user_orm)
-            session.commit()
-
-            user = UserPublicSchema.from_orm(user_orm)
-            tokens = AuthService.create_auth_tokens(user)
-
-            # request email verify
-            _request_email_verify(
-                user_id=user_orm.id,
-                email=user_orm.email
-            )
-
-            return AppUtils.create_response(
-                message="User successfully created",
-                data={
-                    "user": user.model_dump(),
-                    "tokens": tokens
-                }
-            )
-        else:
-            raise CustomError(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="A user with this email already exists"
-            )
+    # Validate user does not exists
+    normalized_email = input.email.strip().lower()
+    if await AuthService.get_user_by_email_async(normalized_email):
+        raise CustomError(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A user with this email already exists"
+        )
+
+    hashed_password = await AuthService.make_hashed_password_async(
+        input.password)
+    async with AsyncDatabaseSession().withSession() as session:
+        user_orm = User(
+            first_name=input.first_name,
+            last_name=input.last_name,
+            email=normalized_email,
+            password=hashed_password
+        )
+        session.add(user_orm)
+        await session.commit()
+
+        user = UserPublicSchema.from_orm(user_orm)
+    tokens = AuthService.create_auth_tokens(user)
+
+    # request email verify
+    await run_in_threadpool(
+        _request_email_verify,
+        user_id=user.id,
+        email=user.email
+    )
+
+    return AppUtils.create_response(
+        message="User successfully created",
+        data={
+            "user": user.model_dump(),
+            "tokens": tokens
+        }
+    )
 
 
 class RefreshTokenInput(BaseModel):
@@ -109,10 +114,10 @@ class RefreshTokenInput(BaseModel):
 
 
 @auth_routes.post("/refresh")
-def access_token_refresh(input: RefreshTokenInput):
+async def access_token_refresh(input: RefreshTokenInput):
 
     # check token blacklist
-    if TokenBlacklistService.is_blacklisted(input.refresh_token):
+    if await TokenBlacklistService.is_blacklisted_async(input.refresh_token):
         raise CustomError(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Refresh token has been blacklisted",
@@ -130,7 +135,17 @@ def access_token_refresh(input: RefreshTokenInput):
         )
 
     user_id = payload.get("id")
-    user = AuthService.get_user_by_id(user_id)
+    # Read from the primary, a replica may not have the revocation yet
+    user = await AuthService.get_user_by_id_async(user_id, read_only=False)
+
+    # Revoked by a token version bump, or the user was deactivated
+    if user is None or not user.active or \
+            payload.get("ver", 0) != user.token_version:
+        raise CustomError(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     access_token = AuthService.create_access_token(user)
 
     return AppUtils.create_response(
@@ -162,12 +177,32 @@ def logout(user: ActiveUser, input: RefreshTokenInput):
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    TokenBlacklistService.blacklist_token(input.refresh_token)
+    TokenBlacklistService.blacklist_token(
+        input.refresh_token,
+        expires_at=datetime.utcfromtimestamp(payload["exp"])
+    )
     return AppUtils.create_response(
         message="Logout successful",
     )
 
 
+@auth_routes.post("/logout-all")
+def logout_all(user: ActiveUser):
+    """Revokes every refresh token of the user.
+
+    Access tokens already issued stay valid until they expire.
+    """
+    with DatabaseSession().withSession() as session:
+        user_orm = session.query(User).where(User.id == user.id).one()
+        AuthService.revoke_tokens(user_orm)
+        session.commit()
+    user_cache.invalidate(user.id)
+
+    return AppUtils.create_response(
+        message="Logged out of all sessions",
+    )
+
+
 class EmailVerifyRequestInput(BaseModel):
     email: str
 
@@ -250,12 +285,20 @@ def email_verify(user: ActiveUser, input: EmailVerifyInput):
         user_orm.is_email_verified = True
         session.add(user_orm)
         session.commit()
+        user = User.__pydantic_model__.from_orm(user_orm)
+    user_cache.invalidate(user.id)
 
     # Delete token
     TokenService.delete_token(token.id)
 
+    # Access tokens carry the verified flag, issue ones that have it set
+    tokens = AuthService.create_auth_tokens(user)
+
     return AppUtils.create_response(
-        message="Email verified successfully"
+        message="Email verified successfully",
+        data={
+            "tokens": tokens
+        }
     )
 
 
@@ -294,16 +337,16 @@ class PasswordResetConfirm(BaseModel):
 
 
 @auth_routes.post("/password-reset/confirm")
-def password_reset(input: PasswordResetConfirm):
+async def password_reset(input: PasswordResetConfirm):
 
-    user = AuthService.get_user_by_email(input.email)
+    user = await AuthService.get_user_by_email_async(input.email)
     if not user:
         raise CustomError(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User does not exists"
         )
 
-    (exists, token) = TokenService.get_by_encoded_token(
+    (exists, token) = await TokenService.get_by_encoded_token_async(
         token=input.token,
         type=TokenTypeEnum.password_reset,
         is_encoded=False,
@@ -317,7 +360,8 @@ def password_reset(input: PasswordResetConfirm):
         )
 
     # Verify user
-    user = AuthService.get_user_by_id(token.user_id)
+    user = await AuthService.get_user_by_id_async(
+        token.user_id, read_only=False)
     if not user:
         raise CustomError(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -325,15 +369,18 @@ def password_reset(input: PasswordResetConfirm):
         )
 
     # Update user
-    with DatabaseSession().withSession() as session:
-        user_orm = session.query(User).where(User.id == user.id).one()
-        hashed_password = AuthService.make_hashed_password(input.password)
+    hashed_password = await AuthService.make_hashed_password_async(
+        input.password)
+    async with AsyncDatabaseSession().withSession() as session:
+        user_orm = await session.get(User, user.id)
         user_orm.password = hashed_password
-        session.add(user_orm)
-        session.commit()
+        # Sign every existing session out
+        AuthService.revoke_tokens(user_orm)
+        await session.commit()
+    user_cache.invalidate(user.id)
 
     # Delete token
-    TokenService.delete_token(token.id)
+    await run_in_threadpool(TokenService.delete_token, token.id)
     return AppUtils.create_response(
         message="Password changed successfully"
     )
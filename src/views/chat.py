@@ -1,16 +1,28 @@
-from fastapi import APIRouter, status, Query
+import json
+import threading
+import uuid
+from typing import List, Literal
+from fastapi import APIRouter, Depends, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import NoResultFound
 from pydantic import BaseModel
-from fastapi_pagination import Page, paginate
-from fastapi_pagination.customization import CustomizedPage, UseFieldsAliases
 from datetime import datetime, timedelta
 
 from src.utils import AppUtils, CustomError
 from src.utils.logger import logger
+from src.utils.pagination import (
+    CursorPage, CursorParams, cursor_params, keyset_paginate
+)
 from src.middlewares.auth import ActiveUser
-from src.models import text_classifier, device, tokenizer, generator
-from src.models.user import User
-from src.models.chat import Chat, Prompt, Sentiment
+from src.services.inference import model_registry
+from src.services.generation import generation_scheduler, trim_to_sentence
+from src.services.sentiment import sentiment_classifier
+from src.services.chat import ChatService
+from src.services.sentiment_rollup import SentimentRollupService
+from src.services.trends import MoodTrendService, trend_memo
+from src.services.semantic_cache import semantic_cache
+from src.config import Config
+from src.models.chat import Chat, Prompt
 from src.schemas.chat import ChatSchema, PromptSchema, SentimentSchema
 from src.models import DatabaseSession
 
@@ -21,160 +33,242 @@ chat_route = APIRouter(
 )
 
 
-PaginationPage = CustomizedPage[
-    Page,
-    UseFieldsAliases(items="data")
-]
-
-
 class PromptInput(BaseModel):
     chat_id: int = None
     prompt: str
+    # Only applied when a new chat is created
+    semantic_cache_enabled: bool = True
+
+
+def _usesSemanticCache(chat_orm: Chat) -> bool:
+    # Cached replies are only valid for the first prompt of a new chat;
+    # the message list can't tell, history may have been truncated
+    return Config.SEMANTIC_CACHE_ENABLED and chat_orm.id is None and \
+        chat_orm.semantic_cache_enabled is not False
+
+
+def _lookupSemanticCache(prompt: str):
+    try:
+        return semantic_cache.lookup(prompt)
+    except Exception as E:
+        logger.error(f"::> Semantic cache lookup failed: {E}")
+        return (None, None)
+
+
+def _generateResponse(
+    messages, prefix_cache_key=None, use_semantic_cache: bool = False
+) -> str:
+    prompt = messages[-1]["content"]
+    if use_semantic_cache:
+        (cached_response, embedding) = _lookupSemanticCache(prompt)
+        if cached_response is not None:
+            return cached_response
+
+    if model_registry.generator is not None:
+        generated_response = generation_scheduler.generate(
+            messages, chat_id=prefix_cache_key)
+        if use_semantic_cache and embedding is not None:
+            semantic_cache.add(prompt, generated_response, embedding)
+    else:
+        logger.error("::> CUDA GPU or GENERATOR_CPU_ENABLED is required")
+        generated_response = "Generator requires a CUDA GPU to run,\
+switch to os with CUDA GPU and try again"
 
+    return generated_response
 
-def _generateResponse(messages) -> str:
-    if generator is not None:
-        # Tokenize inputs
-        input_ids = tokenizer.apply_chat_template(
-            conversation=messages,
-            tokenize=True,
-            add_generation_prompt=True,
-            return_tensors='pt').to(device)
-
-        # Get output ids with dynamic stopping criterion
-        max_tokens = 150  # Define maximum tokens for the response
-        min_length = 20  # Define minimum length for the response
-
-        # get out put ids
-        output_ids = generator.generate(
-            max_length=max_tokens + input_ids.shape[-1],
-            min_length=min_length + input_ids.shape[-1],
-            input_ids=input_ids,
-            do_sample=True,
-            pad_token_id=2,
-        )
 
-        # Response
-        response = tokenizer.batch_decode(
-            output_ids.detach().cpu().numpy(),
-            skip_special_tokens=True
-        )
+def _prefixCacheKey(chat_orm: Chat):
+    # A new chat has no id yet, its first turn is cached under a temporary
+    # key and renamed to the id once saved (see `_keepPrefixCache`)
+    return chat_orm.id if chat_orm.id is not None else uuid.uuid4().hex
 
-        # Extract message
-        generated_response = response[0].split("[/INST]")
-        generated_response = generated_response[1]
 
-        # cut response to return response withing last fullstop index
-        last_full_stop_index = generated_response.rfind(".")
-        if last_full_stop_index != -1:
-            generated_response = generated_response[:last_full_stop_index + 1]
-    else:
-        logger.error("::> CUDA GPU is required")
-        generated_response = "Generator requires a CUDA GPU to run,\
-switch to os with CUDA GPU and try again"
+def _keepPrefixCache(prefix_cache_key, chat_id: int):
+    if prefix_cache_key != chat_id and \
+            generation_scheduler.prefix_cache is not None:
+        generation_scheduler.prefix_cache.rename(prefix_cache_key, chat_id)
 
-    return generated_response
 
+def _classifySentiments(prompt: str):
+    # Every emotion is kept, the top ones are also stored as rows
+    return sentiment_classifier.classify(prompt)
 
-@chat_route.post("/prompt")
-def prompt(user: ActiveUser, body: PromptInput):
 
-    # Retrieve first 3 sentiments
-    generated_sentiments = text_classifier([body.prompt])[0][:3]
-    # Perform DB functions
-    with DatabaseSession().withSession() as session:
-        # Create chat
-        chat_orm = None
-        if body.chat_id is not None:
-            try:
-                chat_orm = session.query(Chat).where(
-                    Chat.id == body.chat_id, Chat.owner_id == user.id).one()
-            except NoResultFound:
-                raise CustomError(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="No Chat found",
-                )
-        else:
-            chat_orm = Chat(
-                title=body.prompt[:40],
-                owner_id=user.id
-            )
-            session.add(chat_orm)
-            session.commit()
+def _getChat(session, user, body: PromptInput) -> Chat:
+    """Loads the user's chat.
 
-        if chat_orm is None:
-            raise CustomError(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="An error occurred while trying to retrieve chat,\
-                    please try again"
-            )
+    When no chat_id is given a new, not yet persisted, chat is returned;
+    it is inserted together with its first prompt.
+    """
+    if body.chat_id is None:
+        return Chat(
+            title=body.prompt[:40],
+            owner_id=user.id,
+            semantic_cache_enabled=body.semantic_cache_enabled
+        )
 
-        prompts = session.query(Prompt).where(Prompt.chat_id == chat_orm.id)
-        prompts = prompts[:5]
+    try:
+        return session.query(Chat).where(
+            Chat.id == body.chat_id, Chat.owner_id == user.id).one()
+    except NoResultFound:
+        raise CustomError(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No Chat found",
+        )
 
-        messages = []
-        messages.append({
-            "role": "user",
-            "content": body.prompt
-        })
 
-        generated_response = _generateResponse(messages)
+@chat_route.post("/prompt")
+def prompt(user: ActiveUser, body: PromptInput):
 
-        # Create prompt
-        prompt_orm = Prompt(
-            chat_id=chat_orm.id,
-            bot_response=generated_response,
-            prompt=body.prompt
+    generated_sentiments = _classifySentiments(body.prompt)
+    # Perform DB functions
+    with DatabaseSession().withSession(user_id=user.id) as session:
+        chat_orm = _getChat(session, user, body)
+        (messages, prompt_token_count) = ChatService.build_messages(
+            session, chat_orm.id, body.prompt)
+
+        prefix_cache_key = _prefixCacheKey(chat_orm)
+        generated_response = _generateResponse(
+            messages,
+            prefix_cache_key,
+            use_semantic_cache=_usesSemanticCache(chat_orm)
         )
-        session.add(prompt_orm)
-        session.commit()
-
-        chat = ChatSchema.from_orm(chat_orm)
-        prompt = PromptSchema.from_orm(prompt_orm)
-        sentiments = []
-
-        # Create sentiments
-        for sentiment in generated_sentiments:
-            # Greater than 30%
-            if sentiment['score'] > 0.3:
-                sentiment_orm = Sentiment(
-                    prompt_id=prompt_orm.id,
-                    score=sentiment['score'],
-                    sentiment=sentiment['label']
-                )
-                session.add(sentiment_orm)
-                session.commit()
 
-                sentiments.append(
-                    SentimentSchema.from_orm(sentiment_orm).model_dump()
-                )
+        data = ChatService.save_turn(
+            session,
+            chat_orm,
+            body.prompt,
+            prompt_token_count,
+            generated_response,
+            generated_sentiments
+        )
+        _keepPrefixCache(prefix_cache_key, chat_orm.id)
+        trend_memo.invalidate(user.id)
 
         # Create Response
         return AppUtils.create_response(
             message="Prompt response",
-            data={
-                "chat": chat.model_dump(),
-                "prompt": prompt.model_dump(),
-                "sentiments": sentiments
-            }
+            data=data
         )
 
 
+def _sseEvent(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@chat_route.post("/prompt/stream")
+def prompt_stream(user: ActiveUser, body: PromptInput):
+    """Server-sent events variant of /prompt.
+
+    Emits a `token` event per decoded chunk, then a `done` event carrying
+    the same data /prompt returns once the prompt has been persisted. When
+    the client disconnects, generation stops and the reply streamed so far
+    is saved, cut at its last full sentence.
+    """
+    generated_sentiments = _classifySentiments(body.prompt)
+    with DatabaseSession().withSession(user_id=user.id) as session:
+        chat_orm = _getChat(session, user, body)
+        chat_id = chat_orm.id
+        new_chat_orm = chat_orm if chat_id is None else None
+        (messages, prompt_token_count) = ChatService.build_messages(
+            session, chat_id, body.prompt)
+        use_semantic_cache = _usesSemanticCache(chat_orm)
+        prefix_cache_key = _prefixCacheKey(chat_orm)
+
+    def save(generated_response: str) -> dict:
+        with DatabaseSession().withSession(user_id=user.id) as session:
+            data = ChatService.save_turn(
+                session,
+                session.get(Chat, chat_id) if chat_id else new_chat_orm,
+                body.prompt,
+                prompt_token_count,
+                generated_response,
+                generated_sentiments
+            )
+        _keepPrefixCache(prefix_cache_key, data["chat"]["id"])
+        trend_memo.invalidate(user.id)
+        return data
+
+    def savePartial(chunks):
+        # Keep what the client was sent, up to its last full sentence;
+        # a turn without any is dropped
+        generated_response = trim_to_sentence("".join(chunks).strip())
+        if not generated_response:
+            return
+        try:
+            save(generated_response)
+        except Exception as E:
+            logger.error(f"::> Saving a cancelled prompt stream: {E}")
+
+    def events():
+        chunks = []
+        (cached_response, embedding) = (None, None)
+        if use_semantic_cache:
+            (cached_response, embedding) = _lookupSemanticCache(body.prompt)
+        try:
+            if cached_response is not None:
+                generated_response = cached_response
+                yield _sseEvent("token", {"text": generated_response})
+            elif model_registry.generator is not None:
+                stream = generation_scheduler.stream(
+                    messages, chat_id=prefix_cache_key)
+                try:
+                    for text in stream:
+                        chunks.append(text)
+                        yield _sseEvent("token", {"text": text})
+                except GeneratorExit:
+                    # The client disconnected: stop generating, and save the
+                    # partial turn off this thread, which may be the loop's
+                    stream.close()
+                    threading.Thread(
+                        target=savePartial, args=(chunks,), daemon=True
+                    ).start()
+                    raise
+                generated_response = trim_to_sentence(
+                    "".join(chunks).strip())
+                if embedding is not None:
+                    semantic_cache.add(
+                        body.prompt, generated_response, embedding)
+            else:
+                generated_response = _generateResponse(messages)
+                yield _sseEvent("token", {"text": generated_response})
+        except Exception as E:
+            logger.error(f"::> Prompt stream failed: {E}")
+            yield _sseEvent("error", {"detail": "Failed to generate response"})
+            return
+
+        data = save(generated_response)
+        yield _sseEvent("done", AppUtils.create_response(
+            message="Prompt response",
+            data=data
+        ))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @chat_route.get("/chats")
-def chats(user: ActiveUser) -> PaginationPage[ChatSchema]:
-    with DatabaseSession().withSession() as session:
-        chats_orm = session.query(Chat).where(
-            Chat.owner_id == user.id
-        )
-        chats = [ChatSchema.from_orm(chat_orm)
-                 for chat_orm in chats_orm]
-        chats.reverse()
-        return paginate(chats)
+def chats(
+    user: ActiveUser,
+    params: CursorParams = Depends(cursor_params)
+) -> CursorPage[ChatSchema]:
+    with DatabaseSession().withSession(read_only=True,
+                                       user_id=user.id) as session:
+        chats_orm = ChatService.chats_query(session, user.id)
+        return keyset_paginate(chats_orm, Chat, ChatSchema, params)
 
 
 @chat_route.get("/prompts/{chat_id}")
-def list_prompts(user: ActiveUser, chat_id: int) -> Page[PromptSchema]:
-    with DatabaseSession().withSession() as session:
+def list_prompts(
+    user: ActiveUser,
+    chat_id: int,
+    params: CursorParams = Depends(cursor_params)
+) -> CursorPage[PromptSchema]:
+    with DatabaseSession().withSession(read_only=True,
+                                       user_id=user.id) as session:
         # ensure user owns chat
         try:
             chat = session.query(Chat).where(
@@ -191,11 +285,8 @@ def list_prompts(user: ActiveUser, chat_id: int) -> Page[PromptSchema]:
             )
 
         # return prompts
-        prompts_orm = session.query(Prompt).where(Prompt.chat_id == chat_id)
-        prompts = [PromptSchema.from_orm(prompt_orm)
-                   for prompt_orm in prompts_orm]
-        prompts.reverse()
-        return paginate(prompts)
+        prompts_orm = ChatService.prompts_query(session, chat_id)
+        return keyset_paginate(prompts_orm, Prompt, PromptSchema, params)
 
 
 @chat_route.get("/sentiments")
@@ -210,7 +301,8 @@ def historical_sentiments(
             description="End date for sentiment analysis (YYYY-MM-DD format)"
         )
 ):
-    with DatabaseSession().withSession() as session:
+    with DatabaseSession().withSession(read_only=True,
+                                       user_id=user.id) as session:
         current_date = datetime.utcnow()
 
         # ensure end date is not greater than current date
@@ -227,15 +319,9 @@ def historical_sentiments(
                 status_code=status.HTTP_400_BAD_REQUEST
             )
 
-        # query chat sentiment belonging to user \
-            # Sentiment.Prompt.Chat.owner_id == user.id
-        sentiments_orm = session.query(Sentiment)\
-            .join(Sentiment.prompt)\
-            .join(Prompt.chat)\
-            .join(Chat.owner)\
-            .where(User.id == user.id)\
-            .where(Sentiment.created_at >= start_date)\
-            .where(Sentiment.created_at <= end_date).all()
+        # query chat sentiment belonging to user
+        sentiments_orm = ChatService.sentiments_query(
+            session, user.id, start_date, end_date).all()
 
         sentiments = [
             SentimentSchema.from_orm(sentiment_orm).model_dump()
@@ -246,3 +332,112 @@ def historical_sentiments(
             message="Sentiment historical data",
             data=sentiments
         )
+
+
+def _dateRange(start_date: datetime, end_date: datetime, days: int):
+    # Defaults are resolved per request, not once at import
+    end_date = end_date or datetime.utcnow()
+    start_date = start_date or end_date - timedelta(days=days)
+    # ensure start date is less than end date
+    if start_date > end_date:
+        raise CustomError(
+            detail="Start date range should be less than end date",
+            status_code=status.HTTP_400_BAD_REQUEST
+        )
+    return (start_date, end_date)
+
+
+def _trendRange(start_date: datetime, end_date: datetime):
+    (start_date, end_date) = _dateRange(start_date, end_date, days=90)
+    return (start_date.date(), end_date.date())
+
+
+@chat_route.get("/sentiments/aggregate")
+def aggregate_sentiments(
+    user: ActiveUser,
+        start_date: datetime = Query(
+            default=None,
+            description="Start date, 365 days before end date by default"
+        ),
+        end_date: datetime = Query(
+            default=None,
+            description="End date, today by default"
+        ),
+        bucket: Literal["day", "week", "month"] = Query(
+            default="day",
+            description="Aggregate per day, week (from Monday) or month"
+        )
+):
+    """Count, mean and max score per emotion and bucket, read from the
+    daily rollups instead of the raw sentiments."""
+    (start_date, end_date) = _dateRange(start_date, end_date, days=365)
+
+    with DatabaseSession().withSession(read_only=True,
+                                       user_id=user.id) as session:
+        return AppUtils.create_response(
+            message="Sentiment aggregates",
+            data=SentimentRollupService.aggregate(
+                session, user.id, start_date, end_date, bucket)
+        )
+
+
+@chat_route.get("/sentiments/trends")
+def sentiment_trends(
+    user: ActiveUser,
+        start_date: datetime = Query(
+            default=None,
+            description="Start date, 90 days before end date by default"
+        ),
+        end_date: datetime = Query(
+            default=None, description="End date, now by default"),
+        window: int = Query(
+            default=7, ge=1, le=90,
+            description="Days in the rolling mean and volatility windows"
+        ),
+        alpha: float = Query(
+            default=0.3, gt=0, le=1, description="EWMA smoothing factor"),
+        emotions: List[str] = Query(
+            default=None, description="Emotions to include, all by default")
+):
+    """Daily mood trends per emotion from the stored emotion vectors."""
+    (start_date, end_date) = _trendRange(start_date, end_date)
+    with DatabaseSession().withSession(read_only=True,
+                                       user_id=user.id) as session:
+        return AppUtils.create_response(
+            message="Sentiment trends",
+            data=MoodTrendService.trends(
+                session, user.id, start_date, end_date,
+                window=window, alpha=alpha, emotions=emotions)
+        )
+
+
+@chat_route.get("/sentiments/trends/change-points")
+def sentiment_change_points(
+    user: ActiveUser,
+        start_date: datetime = Query(
+            default=None,
+            description="Start date, 90 days before end date by default"
+        ),
+        end_date: datetime = Query(
+            default=None, description="End date, now by default"),
+        window: int = Query(
+            default=7, ge=2, le=90,
+            description="Days compared before and after each day"
+        ),
+        threshold: float = Query(
+            default=3.0, gt=0,
+            description="Minimum shift in pooled standard deviations"
+        ),
+        emotions: List[str] = Query(
+            default=None, description="Emotions to include, all by default")
+):
+    """Days on which the average level of an emotion shifted."""
+    (start_date, end_date) = _trendRange(start_date, end_date)
+    with DatabaseSession().withSession(read_only=True,
+                                       user_id=user.id) as session:
+        return AppUtils.create_response(
+            message="Sentiment change points",
+            data=MoodTrendService.change_points(
+                session, user.id, start_date, end_date,
+                window=window, threshold=threshold, emotions=emotions)
+        )
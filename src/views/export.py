@@ -0,0 +1,37 @@
+from datetime import datetime
+
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+
+from src.middlewares.auth import ActiveUser, AdminUser
+from src.services.export import ExportService
+
+
+export_router = APIRouter(
+    prefix="/export", tags=['export']
+)
+
+
+def _ndjsonResponse(name: str, user_id: int = None) -> StreamingResponse:
+    filename = f"{name}-{datetime.utcnow():%Y%m%d%H%M%S}.ndjson"
+    return StreamingResponse(
+        ExportService.ndjson(user_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@export_router.get("/me")
+def export_me(user: ActiveUser):
+    """Streams the user's chats, prompts and sentiments as NDJSON."""
+    return _ndjsonResponse("mhc-export", user.id)
+
+
+@export_router.get("/all")
+def export_all(user: AdminUser):
+    """Streams every chat, prompt and sentiment as NDJSON.
+
+    For large exports prefer `python -m src.scripts.export`, which writes
+    Parquet and does not hold a request open.
+    """
+    return _ndjsonResponse("mhc-export-all")
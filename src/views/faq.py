@@ -41,7 +41,7 @@ def create_faq(user: AdminUser, body: FaqCreateInput):
 
 @faqs_router.get("/")
 def list_faq():
-    with DatabaseSession().withSession() as session:
+    with DatabaseSession().withSession(read_only=True) as session:
         faq_orm = session.query(Faq).all()
         faqs = [
             FaqSchema.from_orm(faq_orm_item).model_dump()
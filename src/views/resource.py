@@ -1,6 +1,4 @@
-from fastapi import APIRouter, File, UploadFile, Form
-from fastapi_pagination.customization import CustomizedPage, UseFieldsAliases
-from fastapi_pagination import Page, paginate
+from fastapi import APIRouter, Depends, File, UploadFile, Form
 from pydantic import BaseModel
 from src.config import Config
 from typing import Annotated
@@ -11,6 +9,9 @@ from src.schemas.resource import ResourceSchema
 from src.models import DatabaseSession
 from src.middlewares.auth import AdminUser
 from src.utils import AppUtils
+from src.utils.pagination import (
+    CursorPage, CursorParams, cursor_params, keyset_paginate
+)
 import cloudinary
 import cloudinary.uploader
 
@@ -23,20 +24,14 @@ cloudinary.config(
 resources_router = APIRouter(prefix="/resource", tags=['resource'])
 
 
-PaginationPage = CustomizedPage[
-    Page,
-    UseFieldsAliases(items="data")
-]
-
-
 @resources_router.get("/resources")
-def list_resources() -> PaginationPage[ResourceSchema]:
-    with DatabaseSession().withSession() as session:
-        resources_orm = session.query(Resource).all()
-        resources = [ResourceSchema.from_orm(resource_orm)
-                     for resource_orm in resources_orm]
-        resources.reverse()
-        return paginate(resources)
+def list_resources(
+    params: CursorParams = Depends(cursor_params)
+) -> CursorPage[ResourceSchema]:
+    with DatabaseSession().withSession(read_only=True) as session:
+        resources_orm = session.query(Resource)
+        return keyset_paginate(
+            resources_orm, Resource, ResourceSchema, params)
 
 
 class ResourceDataInput(BaseModel):
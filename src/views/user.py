@@ -3,10 +3,13 @@ from pydantic import BaseModel
 from typing import Optional
 from src.middlewares.auth import ActiveUser
 from src.schemas.user import (
-    UserPublicSchema
+    UserPublicSchema,
+    UserSchema
 )
 from src.models.user import User
 from src.models import DatabaseSession
+from src.services.auth import AuthService
+from src.services.user_cache import user_cache
 from src.utils import AppUtils
 
 user_routes = APIRouter(
@@ -17,6 +20,9 @@ user_routes = APIRouter(
 
 @user_routes.get("/me")
 def get_me(user: ActiveUser):
+    if not isinstance(user, UserSchema):
+        # Stateless auth only carries the claims, load the full user
+        user = AuthService.get_user_by_id(user.id)
     public_user = UserPublicSchema(**user.dict())
     return AppUtils.create_response(
         message="User",
@@ -42,6 +48,7 @@ def update_me(user: ActiveUser, input: UpdateUserInput):
 
         # load user
         user = UserPublicSchema.from_orm(user_orm)
+    user_cache.invalidate(user.id)
 
     return AppUtils.create_response(
         message="User updated",